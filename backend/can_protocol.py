@@ -3,166 +3,301 @@ CAN 协议解析器和生成器
 基于: 80kW燃料电池测试台架手动&自动测试CAN通信协议 (2023.2)
 """
 
+import json
+import logging
 import struct
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+logger = logging.getLogger(__name__)
+
+# orjson 可选: 编解码更快，未安装时回退到标准库 json (server/diagnosis 共用这一对函数)。
+# orjson 输出为 UTF-8 bytes，需 decode 为 str 以文本帧发送 (前端按文本 JSON.parse)
+try:
+    import orjson
+    def _json_dumps(obj: Any, indent: bool = False) -> str:
+        """indent=True 时按 2 空格缩进 (orjson 仅支持 2 空格)"""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj: Any, indent: bool = False) -> str:
+        """indent=True 时按 2 空格缩进 (与 orjson 输出一致)"""
+        return json.dumps(obj, indent=2 if indent else None)
+    _json_loads = json.loads
+
+# 预编译的 struct 格式 (避免每帧重复解析格式字符串)
+_MSG1_MAIN = struct.Struct('<BBHHH')     # 心跳, 状态字节, 电堆电压, 电堆电流, 氢循泵转速
+_MSG2_H2 = struct.Struct('<HBHBB')       # 氢气高压, 进堆压力, 进堆流量, 出堆压力, 进堆温度
+_MSG4_WATER = struct.Struct('<BBBBHH')   # 水压, 进水温, 出水温, 电导率, 空压机给定/实际转速
+_MSG7_DCDC = struct.Struct('>HHHH')      # 输出电压, 输出电流, 输入电压, 输入电流 (大端)
+
+# 控制报文发送缓冲区 (模块级复用，每次整帧覆盖写入，输出时复制为 bytes)
+_TX_BUF_27 = bytearray(8)
+_TX_BUF_28 = bytearray(8)
+_TX_BUF_32 = bytearray(8)
+
+# 控制报文布局 (pack_into 一次写入多个字段, 'x' 为填充的保留字节)
+_CTRL27 = struct.Struct('<BBBxHBx')     # 开关量 Byte 1-3, Byte 4 保留, 目标电流, 模式/指令, Byte 8 保留
+_CTRL28 = struct.Struct('<BBHBBH')       # 节气门x2, 空压机转速, 水泵, 节温器, 氢循泵转速
+_CTRL32 = struct.Struct('>3xHHx')        # Byte 4-5 输出电压, Byte 6-7 输入限流 (大端)
+
+# 控制报文 Byte 7 的模式/指令位映射 (未列出的取值按 0 处理)
+_MODE_BITS = {"AUTO": 0x03}     # 00=手动, 11=自动
+_CMD_BITS = {
+    "START": 0x03,              # Binary 11
+    "RESET": 0x01,              # Binary 01
+    "EMERGENCY_STOP": 0x02,     # Binary 10
+    "STOP": 0x00,               # Binary 00
+}
+
+# 单字节温度查找表: 原始值 -> ℃ (偏移 -40)
+_TEMP_LUT = tuple(i - 40 for i in range(256))
+
+# 字节 -> (bit0, ..., bit7) 布尔元组查找表，用于 IO 状态字节解码
+_BYTE_TO_BITS = tuple(tuple(bool((i >> k) & 1) for k in range(8)) for i in range(256))
+
+
+# 以下数据分组均使用 __slots__: 字段访问为固定槽位偏移，避免实例字典哈希
+class StatusData:
+    """系统状态"""
+    __slots__ = ("heartbeat", "state", "faultLevel", "dcdcState", "dcdcFaultCode")
+
+    def __init__(self):
+        self.heartbeat = 0
+        self.state = 0          # 0=关机完成, 1=关机中, 2=运行, 3=急停, 0xF=故障, 0x10=复位, 0x11=启动中
+        self.faultLevel = 0     # 0=无, 1=一级, 2=二级, 3=三级
+        self.dcdcState = 0      # 0=停止, 1=运行, 2=放电
+        self.dcdcFaultCode = 0
+
+
+class PowerData:
+    """电堆及DCDC电源数据"""
+    __slots__ = ("stackVoltage", "stackCurrent", "stackPower", "dcdcOutVoltage",
+                 "dcdcOutCurrent", "dcdcInVoltage", "dcdcInCurrent", "conductivity")
+
+    def __init__(self):
+        self.stackVoltage = 0.0      # V
+        self.stackCurrent = 0.0      # A
+        self.stackPower = 0.0        # kW (计算值)
+        self.dcdcOutVoltage = 0.0    # V
+        self.dcdcOutCurrent = 0.0    # A
+        self.dcdcInVoltage = 0.0     # V
+        self.dcdcInCurrent = 0.0     # A
+        self.conductivity = 0.0      # S/m
+
+
+class H2Data:
+    """氢气路传感器 (H2)"""
+    __slots__ = ("highPressure", "inletPressure", "outletPressure", "inletFlow",
+                 "inletTemp", "circulationSpeed", "separatorPressure", "concentration")
+
+    def __init__(self):
+        self.highPressure = 0.0      # kPa (氢气高压)
+        self.inletPressure = 0.0     # kPa (进堆压力)
+        self.outletPressure = 0.0    # kPa (出堆压力)
+        self.inletFlow = 0.0         # L/min
+        self.inletTemp = 0.0         # ℃
+        self.circulationSpeed = 0    # rpm (循环泵)
+        self.separatorPressure = 0.0 # kPa (汽水分离器)
+        self.concentration = 0.0     # %vol (氢气浓度, 仅 can_protocol1 协议提供)
+
+
+class AirData:
+    """空气路传感器 (Air)"""
+    __slots__ = ("inletPressure", "inletTemp", "outletPressure", "outletTemp",
+                 "inletFlow", "humidity", "compressorSetSpeed", "compressorRealSpeed")
+
+    def __init__(self):
+        self.inletPressure = 0.0     # kPa
+        self.inletTemp = 0.0         # ℃
+        self.outletPressure = 0.0    # kPa
+        self.outletTemp = 0.0        # ℃
+        self.inletFlow = 0.0         # kg/h
+        self.humidity = 0.0          # %
+        self.compressorSetSpeed = 0  # rpm
+        self.compressorRealSpeed = 0 # rpm
+
+
+class WaterData:
+    """冷却水路传感器 (Water)"""
+    __slots__ = ("inletPressure", "inletTemp", "outletTemp",
+                 "auxOutletTemp", "auxDcdcTemp", "auxCompTemp")
+
+    def __init__(self):
+        self.inletPressure = 0.0     # kPa
+        self.inletTemp = 0.0         # ℃
+        self.outletTemp = 0.0        # ℃
+        self.auxOutletTemp = 0.0     # ℃ (辅助散热出口)
+        self.auxDcdcTemp = 0.0       # ℃
+        self.auxCompTemp = 0.0       # ℃
+
+
+class TempData:
+    """设备温度"""
+    __slots__ = ("dcdcTemp",)
+
+    def __init__(self):
+        self.dcdcTemp = 0.0          # ℃
+
+
+class IOData:
+    """IO 执行器状态"""
+    __slots__ = ("h2HighValve", "h2HeatValve", "h2PurgeValve",
+                 "h2Injector0", "h2Injector1", "h2Injector2", "h2Injector3", "h2CircPump",
+                 "airInletThrottle", "airOutletThrottle", "compressor", "bypassValve",
+                 "mainPump", "mainFan", "thermostatState",
+                 "waterLevelLow", "auxFan", "auxPump", "ptcHeater",
+                 "thermostatPosition", "airInletThrottlePos", "airOutletThrottlePos",
+                 "h2PurgeCountdown", "fan1Duty")
+
+    def __init__(self):
+        # 开关量 (True/False)
+        self.h2HighValve = False     # 氢气高压阀
+        self.h2HeatValve = False     # 氢气加热阀
+        self.h2PurgeValve = False    # 氢气排氢阀
+        self.h2Injector0 = False     # 喷射阀 1-4 (独立槽位，避免列表索引)
+        self.h2Injector1 = False
+        self.h2Injector2 = False
+        self.h2Injector3 = False
+        self.h2CircPump = False      # 氢气循环泵
+
+        self.airInletThrottle = False  # 空气进气节气门
+        self.airOutletThrottle = False # 空气尾排节气门
+        self.compressor = False        # 空压机
+        self.bypassValve = False       # 旁通阀
+        self.mainPump = False          # 主散热水泵
+        self.mainFan = False           # 主散热器(风扇)
+        self.thermostatState = 0       # 0=关, 1=小循环, 2=大循环
+
+        self.waterLevelLow = False     # 液位低 (原始1为正常，此处转为报警逻辑)
+        self.auxFan = False            # 辅助散热器
+        self.auxPump = False           # 辅助水泵
+        self.ptcHeater = False         # PTC
+
+        # 模拟量反馈
+        self.thermostatPosition = 0    # %
+        self.airInletThrottlePos = 0   # %
+        self.airOutletThrottlePos = 0  # %
+        self.h2PurgeCountdown = 0      # s
+        self.fan1Duty = 0              # % (风扇1占空比, 仅 can_protocol1 协议提供)
+
+
+class FaultData:
+    """故障码 (8个字节)"""
+    __slots__ = ("codes",)
+
+    def __init__(self):
+        self.codes = [0] * 8
+
 
 class MachineState:
     """H2 FCU 完整状态机数据结构"""
+
+    __slots__ = ("connected", "last_update", "status", "power", "h2", "air",
+                 "water", "temps", "io", "faults", "_dirty", "_cached_dict", "_cached_json")
     
     def __init__(self):
         self.connected = False
         self.last_update = 0
         
-        # 系统状态
-        self.status = {
-            "heartbeat": 0,
-            "state": 0,       # 0=关机完成, 1=关机中, 2=运行, 3=急停, 0xF=故障, 0x10=复位, 0x11=启动中
-            "faultLevel": 0,  # 0=无, 1=一级, 2=二级, 3=三级
-            "dcdcState": 0,   # 0=停止, 1=运行, 2=放电
-            "dcdcFaultCode": 0
-        }
-        
-        # 电堆及DCDC电源数据
-        self.power = {
-            "stackVoltage": 0.0,      # V
-            "stackCurrent": 0.0,      # A
-            "stackPower": 0.0,        # kW (计算值)
-            "dcdcOutVoltage": 0.0,    # V
-            "dcdcOutCurrent": 0.0,    # A
-            "dcdcInVoltage": 0.0,     # V
-            "dcdcInCurrent": 0.0,     # A
-            "conductivity": 0.0       # S/m
-        }
+        # to_dict 结果缓存: 解析函数入口即置 _dirty (调用方每收到一帧已知报文都会更新
+        # last_update，长度不足的帧同样需要失效)，未变化时直接复用上次结果
+        # 输出字典结构固定，只在一次构建后原地更新叶子值，不再重复分配嵌套字典
+        self._dirty = True
+        self._cached_dict = {"connected": False, "lastUpdate": 0,
+                             "status": {}, "power": {}, "sensors": {}, "io": {}}
+        self._cached_json = None     # to_json 的编码结果，随 _cached_dict 一起失效
         
-        # 氢气路传感器 (H2)
-        self.h2 = {
-            "highPressure": 0.0,      # kPa (氢气高压)
-            "inletPressure": 0.0,     # kPa (进堆压力)
-            "outletPressure": 0.0,    # kPa (出堆压力)
-            "inletFlow": 0.0,         # L/min
-            "inletTemp": 0.0,         # ℃
-            "circulationSpeed": 0,    # rpm (循环泵)
-            "separatorPressure": 0.0  # kPa (汽水分离器)
-        }
+        self.status = StatusData()   # 系统状态
+        self.power = PowerData()     # 电堆及DCDC电源数据
+        self.h2 = H2Data()           # 氢气路传感器
+        self.air = AirData()         # 空气路传感器
+        self.water = WaterData()     # 冷却水路传感器
+        self.temps = TempData()      # 设备温度
+        self.io = IOData()           # IO 执行器状态
+        self.faults = FaultData()    # 故障码
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert to dictionary for JSON serialization with frontend compatibility
+        始终返回同一个字典对象 (数据变化时原地更新)，调用方只读；需要保留快照时请复制
+        """
+        if self._dirty:
+            self._fill_dict(self._cached_dict)
+            self._cached_json = None
+            self._dirty = False
+        return self._cached_dict
+    
+    def to_json(self) -> str:
+        """to_dict 的 JSON 文本，同一状态只编码一次 (供广播复用)"""
+        data = self.to_dict()
+        if self._cached_json is None:
+            self._cached_json = _json_dumps(data)
+        return self._cached_json
+    
+    def _fill_dict(self, out: Dict[str, Any]) -> None:
+        """将当前状态按前端格式写入 out 的各叶子字段"""
+        # 多次读取的分组绑定为局部变量
+        status = self.status
+        power = self.power
+        h2 = self.h2
+        io = self.io
+        faults = self.faults
         
-        # 空气路传感器 (Air)
-        self.air = {
-            "inletPressure": 0.0,     # kPa
-            "inletTemp": 0.0,         # ℃
-            "outletPressure": 0.0,    # kPa
-            "outletTemp": 0.0,        # ℃
-            "inletFlow": 0.0,         # kg/h
-            "humidity": 0.0,          # %
-            "compressorSetSpeed": 0,  # rpm
-            "compressorRealSpeed": 0  # rpm
-        }
+        # 计算衍生值
+        dcf_power = round(power.dcdcOutVoltage * power.dcdcOutCurrent, 2)
+        stack_power = round(power.stackPower, 2)
+        dcf_efficiency = 0
+        if stack_power > 0:
+            dcf_efficiency = round((dcf_power / (stack_power * 1000)) * 100, 1)
         
-        # 冷却水路传感器 (Water)
-        self.water = {
-            "inletPressure": 0.0,     # kPa
-            "inletTemp": 0.0,         # ℃
-            "outletTemp": 0.0,        # ℃
-            "auxOutletTemp": 0.0,     # ℃ (辅助散热出口)
-            "auxDcdcTemp": 0.0,       # ℃
-            "auxCompTemp": 0.0        # ℃
-        }
+        out["connected"] = self.connected
+        out["lastUpdate"] = self.last_update
         
-        # 设备温度
-        self.temps = {
-            "dcdcTemp": 0.0           # ℃
-        }
+        # 系统状态 - 直接映射
+        d = out["status"]
+        d["heartbeat"] = status.heartbeat
+        d["state"] = status.state
+        d["faultLevel"] = status.faultLevel
         
-        # IO 执行器状态
-        self.io = {
-            # 开关量 (True/False)
-            "h2HighValve": False,     # 氢气高压阀
-            "h2HeatValve": False,     # 氢气加热阀
-            "h2PurgeValve": False,    # 氢气排氢阀
-            "h2Injectors": [False]*4, # 喷射阀 1-4
-            "h2CircPump": False,      # 氢气循环泵
-            
-            "airInletThrottle": False, # 空气进气节气门
-            "airOutletThrottle": False,# 空气尾排节气门
-            "compressor": False,       # 空压机
-            "bypassValve": False,      # 旁通阀
-            "mainPump": False,         # 主散热水泵
-            "mainFan": False,          # 主散热器(风扇)
-            "thermostatState": 0,      # 0=关, 1=小循环, 2=大循环
-            
-            "waterLevelLow": False,    # 液位低 (原始1为正常，此处转为报警逻辑)
-            "auxFan": False,           # 辅助散热器
-            "auxPump": False,          # 辅助水泵
-            "ptcHeater": False,        # PTC
-            
-            # 模拟量反馈
-            "thermostatPosition": 0,   # %
-            "airInletThrottlePos": 0,  # %
-            "airOutletThrottlePos": 0, # %
-            "h2PurgeCountdown": 0      # s
-        }
+        # 电源数据 - 映射到前端期望的字段名
+        d = out["power"]
+        d["stackVoltage"] = power.stackVoltage
+        d["stackCurrent"] = power.stackCurrent
+        d["stackPower"] = stack_power
+        d["dcfVoltage"] = power.dcdcOutVoltage  # 映射: dcdcOutVoltage -> dcfVoltage
+        d["dcfCurrent"] = power.dcdcOutCurrent  # 映射: dcdcOutCurrent -> dcfCurrent
+        d["dcfPower"] = dcf_power
+        d["dcfEfficiency"] = dcf_efficiency
         
-        # 故障码 (8个字节)
-        self.faults = {
-            "codes": [0] * 8
-        }
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """Convert to dictionary for JSON serialization with frontend compatibility"""
-        # 计算衍生值
-        dcf_power = round(self.power["dcdcOutVoltage"] * self.power["dcdcOutCurrent"], 2)
-        dcf_efficiency = 0
-        if self.power["stackPower"] > 0:
-            dcf_efficiency = round((dcf_power / (self.power["stackPower"] * 1000)) * 100, 1)
+        # 传感器数据 - 从多个来源聚合
+        d = out["sensors"]
+        d["stackTemp"] = self.water.outletTemp  # 电堆温度用出水温度
+        d["ambientTemp"] = self.air.inletTemp  # 环境温度用进气温度
+        d["h2CylinderPressure"] = h2.highPressure / 1000.0  # kPa -> MPa
+        d["h2InletPressure"] = h2.inletPressure / 1000.0  # kPa -> MPa
+        d["h2Concentration"] = 0  # 当前协议未提供氢气浓度传感器
         
-        return {
-            "connected": self.connected,
-            "lastUpdate": self.last_update,
-            
-            # 系统状态 - 直接映射
-            "status": {
-                "heartbeat": self.status["heartbeat"],
-                "state": self.status["state"],
-                "faultLevel": self.status["faultLevel"]
-            },
-            
-            # 电源数据 - 映射到前端期望的字段名
-            "power": {
-                "stackVoltage": self.power["stackVoltage"],
-                "stackCurrent": self.power["stackCurrent"],
-                "stackPower": self.power["stackPower"],
-                "dcfVoltage": self.power["dcdcOutVoltage"],    # 映射: dcdcOutVoltage -> dcfVoltage
-                "dcfCurrent": self.power["dcdcOutCurrent"],    # 映射: dcdcOutCurrent -> dcfCurrent
-                "dcfPower": dcf_power,
-                "dcfEfficiency": dcf_efficiency
-            },
-            
-            # 传感器数据 - 从多个来源聚合
-            "sensors": {
-                "stackTemp": self.water.get("outletTemp", 25),  # 电堆温度用出水温度
-                "ambientTemp": self.air.get("inletTemp", 25),   # 环境温度用进气温度
-                "h2CylinderPressure": self.h2.get("highPressure", 0) / 1000.0,  # kPa -> MPa
-                "h2InletPressure": self.h2.get("inletPressure", 0) / 1000.0,    # kPa -> MPa
-                "h2Concentration": 0  # 当前协议未提供氢气浓度传感器
-            },
-            
-            # IO状态 - 映射到前端期望的字段
-            "io": {
-                "h2InletValve": self.io.get("h2HighValve", False),      # 映射: h2HighValve -> h2InletValve
-                "h2PurgeValve": self.io.get("h2PurgeValve", False),
-                "proportionalValve": False,  # 当前协议未提供
-                "heater": self.io.get("ptcHeater", False),              # 映射: ptcHeater -> heater
-                "fan1": self.io.get("mainFan", False),                   # 映射: mainFan -> fan1
-                "fan2": self.io.get("auxFan", False),                    # 映射: auxFan -> fan2
-                "fan1Duty": 0,  # 当前协议未提供风扇占空比反馈
-                "dcfMosTemp": self.temps.get("dcdcTemp", 25),           # 映射: dcdcTemp -> dcfMosTemp
-                "faultCode": self.faults["codes"][0] if self.faults["codes"] else 0
-            }
-        }
+        # IO状态 - 映射到前端期望的字段
+        d = out["io"]
+        d["h2InletValve"] = io.h2HighValve  # 映射: h2HighValve -> h2InletValve
+        d["h2PurgeValve"] = io.h2PurgeValve
+        d["proportionalValve"] = False  # 当前协议未提供
+        d["heater"] = io.ptcHeater  # 映射: ptcHeater -> heater
+        d["fan1"] = io.mainFan  # 映射: mainFan -> fan1
+        d["fan2"] = io.auxFan  # 映射: auxFan -> fan2
+        d["fan1Duty"] = 0  # 当前协议未提供风扇占空比反馈
+        d["dcfMosTemp"] = self.temps.dcdcTemp  # 映射: dcdcTemp -> dcfMosTemp
+        d["faultCode"] = faults.codes[0] if faults.codes else 0
+
 
 # ==============================================================================
 # 解析函数定义
 # ==============================================================================
 
+# 各解析函数的共同约定:
+# - 入口即置 state._dirty = True，令 to_dict 缓存失效 (长度不足提前返回也一样)
+# - 多次访问的数据分组先绑定为局部变量，避免重复属性查找
+
 def parse_msg_1_main(data: bytes, state: MachineState) -> None:
     """
     ID: 0x1824A7A4 (周期 100ms) - FCU 主控 1
@@ -172,40 +307,37 @@ def parse_msg_1_main(data: bytes, state: MachineState) -> None:
     Byte 5-6: 电堆电流 (LSB)
     Byte 7-8: 氢气循环泵转速 (LSB)
     """
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.info(f"🔧 parse_msg_1_main被调用! 数据长度={len(data)}")
-    
+    state._dirty = True
     if len(data) < 8:
-        logger.warning(f"⚠️ 数据长度不足: {len(data)} < 8")
+        logger.warning("⚠️ 数据长度不足: %d < 8", len(data))
         return
 
-    # Byte 1: Heartbeat
-    state.status["heartbeat"] = data[0]
+    status = state.status
+    power = state.power
+
+    # Byte 1: 心跳, Byte 2: 状态, Byte 3-4: 电堆电压 (1V/bit),
+    # Byte 5-6: 电堆电流 (1A/bit), Byte 7-8: 氢循泵转速 (1rpm/bit)
+    heartbeat, b2, raw_v, raw_i, raw_pump = _MSG1_MAIN.unpack_from(data, 0)
+    status.heartbeat = heartbeat
     
     # Byte 2: Status & Fault Level
     # 假设 bit 0-1 是故障等级, bit 2-7 是状态
-    b2 = data[1]
-    state.status["faultLevel"] = b2 & 0x03
-    state.status["state"] = (b2 >> 2) & 0x3F
+    status.faultLevel = b2 & 0x03
+    status.state = (b2 >> 2) & 0x3F
     
-    # Byte 3-4: Stack Voltage (1V/bit)
-    stack_v = struct.unpack('<H', data[2:4])[0] * 1.0
+    stack_v = raw_v * 1.0
+    stack_i = raw_i * 1.0
+    pump_speed = raw_pump * 1.0
+
+    power.stackVoltage = stack_v
+    power.stackCurrent = stack_i
+    power.stackPower = stack_v * stack_i / 1000.0 # kW (显示精度在 to_dict 中处理)
+    state.h2.circulationSpeed = int(pump_speed)
     
-    # Byte 5-6: Stack Current (1A/bit)
-    stack_i = struct.unpack('<H', data[4:6])[0] * 1.0
-    
-    # Byte 7-8: H2 Pump Speed (1rpm/bit)
-    pump_speed = struct.unpack('<H', data[6:8])[0] * 1.0
-
-    state.power["stackVoltage"] = stack_v
-    state.power["stackCurrent"] = stack_i
-    state.power["stackPower"] = round(stack_v * stack_i / 1000.0, 2) # kW
-    state.h2["circulationSpeed"] = int(pump_speed)
-    
-    # 无条件打印解析结果
-    logger.info(f"✅ 解析完成: 心跳={state.status['heartbeat']}, 状态={state.status['state']}, "
-               f"电压={stack_v}V, 电流={stack_i}A, connected={state.connected}")
+    # 解析结果仅在 DEBUG 级别输出 (热路径上不做字符串格式化)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("✅ 解析完成: 心跳=%s, 状态=%s, 电压=%sV, 电流=%sA, connected=%s",
+                     heartbeat, status.state, stack_v, stack_i, state.connected)
 
 
 def parse_msg_2_h2(data: bytes, state: MachineState) -> None:
@@ -217,13 +349,17 @@ def parse_msg_2_h2(data: bytes, state: MachineState) -> None:
     Byte 6: 出堆氢气压力 (1kPa)
     Byte 7: 进堆氢气温度 (1C, off -40)
     """
+    state._dirty = True
     if len(data) < 7: return
+
+    h2 = state.h2
     
-    state.h2["highPressure"] = struct.unpack('<H', data[0:2])[0]
-    state.h2["inletPressure"] = data[2]
-    state.h2["inletFlow"] = struct.unpack('<H', data[3:5])[0]
-    state.h2["outletPressure"] = data[5]
-    state.h2["inletTemp"] = data[6] - 40
+    high_p, inlet_p, inlet_flow, outlet_p, inlet_t = _MSG2_H2.unpack_from(data, 0)
+    h2.highPressure = high_p
+    h2.inletPressure = inlet_p
+    h2.inletFlow = inlet_flow
+    h2.outletPressure = outlet_p
+    h2.inletTemp = _TEMP_LUT[inlet_t]
 
 
 def parse_msg_3_air(data: bytes, state: MachineState) -> None:
@@ -237,15 +373,18 @@ def parse_msg_3_air(data: bytes, state: MachineState) -> None:
     Byte 7: 出堆空气相对湿度 (1%)
     Byte 8: 节温器阀芯位置反馈 (1%)
     """
+    state._dirty = True
     if len(data) < 8: return
 
-    state.air["inletPressure"] = data[0]
-    state.air["inletTemp"] = data[1] - 40
-    state.air["outletPressure"] = data[2]
-    state.air["outletTemp"] = data[3] - 40
-    state.air["inletFlow"] = struct.unpack('<H', data[4:6])[0]
-    state.air["humidity"] = data[6]
-    state.io["thermostatPosition"] = data[7]
+    air = state.air
+
+    air.inletPressure = data[0]
+    air.inletTemp = _TEMP_LUT[data[1]]
+    air.outletPressure = data[2]
+    air.outletTemp = _TEMP_LUT[data[3]]
+    air.inletFlow = data[4] | (data[5] << 8)  # 单个 u16 (小端) 直接移位组合，比 struct 调用更快
+    air.humidity = data[6]
+    state.io.thermostatPosition = data[7]
 
 
 def parse_msg_4_water(data: bytes, state: MachineState) -> None:
@@ -258,14 +397,19 @@ def parse_msg_4_water(data: bytes, state: MachineState) -> None:
     Byte 5-6: 空压机给定转速 (LSB, 1rpm)
     Byte 7-8: 空压机实际转速 (LSB, 1rpm)
     """
+    state._dirty = True
     if len(data) < 8: return
 
-    state.water["inletPressure"] = data[0]
-    state.water["inletTemp"] = data[1] - 40
-    state.water["outletTemp"] = data[2] - 40
-    state.power["conductivity"] = round(data[3] * 0.1, 2)
-    state.air["compressorSetSpeed"] = struct.unpack('<H', data[4:6])[0]
-    state.air["compressorRealSpeed"] = struct.unpack('<H', data[6:8])[0]
+    air = state.air
+    water = state.water
+
+    inlet_p, inlet_t, outlet_t, cond, comp_set, comp_real = _MSG4_WATER.unpack_from(data, 0)
+    water.inletPressure = inlet_p
+    water.inletTemp = _TEMP_LUT[inlet_t]
+    water.outletTemp = _TEMP_LUT[outlet_t]
+    state.power.conductivity = cond * 0.1
+    air.compressorSetSpeed = comp_set
+    air.compressorRealSpeed = comp_real
 
 
 def parse_msg_5_io(data: bytes, state: MachineState) -> None:
@@ -279,43 +423,35 @@ def parse_msg_5_io(data: bytes, state: MachineState) -> None:
     Byte 6: 尾排节气门反馈
     Byte 7-8: 给定节气门开度 (此处不解析给定值，仅关注反馈)
     """
+    state._dirty = True
     if len(data) < 6: return
 
-    # Byte 1
-    b1 = data[0]
-    state.io["h2HighValve"] = bool(b1 & 0x01)
-    state.io["h2HeatValve"] = bool(b1 & 0x02)
-    state.io["h2PurgeValve"] = bool(b1 & 0x04)
-    state.io["h2Injectors"][0] = bool(b1 & 0x08)
-    state.io["h2Injectors"][1] = bool(b1 & 0x10)
-    state.io["h2Injectors"][2] = bool(b1 & 0x20)
-    state.io["h2Injectors"][3] = bool(b1 & 0x40)
-    state.io["h2CircPump"] = bool(b1 & 0x80)
+    io = state.io
 
-    # Byte 2
+    # 每个字节查表得到 bit0..bit7 的布尔值，不再逐位 bool(b & mask)
+    # Byte 1: bit0 高压阀, bit1 加热阀, bit2 排氢阀, bit3-6 喷射阀 1-4, bit7 循环泵
+    (io.h2HighValve, io.h2HeatValve, io.h2PurgeValve,
+     io.h2Injector0, io.h2Injector1, io.h2Injector2, io.h2Injector3,
+     io.h2CircPump) = _BYTE_TO_BITS[data[0]]
+
+    # Byte 2: bit0-5 开关量
     b2 = data[1]
-    state.io["airInletThrottle"] = bool(b2 & 0x01)
-    state.io["airOutletThrottle"] = bool(b2 & 0x02)
-    state.io["compressor"] = bool(b2 & 0x04)
-    state.io["bypassValve"] = bool(b2 & 0x08)
-    state.io["mainPump"] = bool(b2 & 0x10)
-    state.io["mainFan"] = bool(b2 & 0x20)
+    (io.airInletThrottle, io.airOutletThrottle, io.compressor,
+     io.bypassValve, io.mainPump, io.mainFan,
+     _, _) = _BYTE_TO_BITS[b2]
     # 节温器状态 (Bits 6-7): 00关闭, 01小, 10大
-    therm_bits = (b2 >> 6) & 0x03
-    state.io["thermostatState"] = therm_bits
+    io.thermostatState = (b2 >> 6) & 0x03
 
     # Byte 3
-    b3 = data[2]
     # Bit 0: 液位 (0低-红, 1正常-绿) -> 转换为报警逻辑 True=Warning
-    state.io["waterLevelLow"] = not bool(b3 & 0x01)
-    state.io["auxFan"] = bool(b3 & 0x02)
-    state.io["auxPump"] = bool(b3 & 0x04)
-    state.io["ptcHeater"] = bool(b3 & 0x08)
+    (level_ok, io.auxFan, io.auxPump, io.ptcHeater,
+     _, _, _, _) = _BYTE_TO_BITS[data[2]]
+    io.waterLevelLow = not level_ok
 
     # Byte 4-6
-    state.io["h2PurgeCountdown"] = data[3]
-    state.io["airInletThrottlePos"] = data[4]
-    state.io["airOutletThrottlePos"] = data[5]
+    io.h2PurgeCountdown = data[3]
+    io.airInletThrottlePos = data[4]
+    io.airOutletThrottlePos = data[5]
 
 
 def parse_msg_6_aux(data: bytes, state: MachineState) -> None:
@@ -329,15 +465,19 @@ def parse_msg_6_aux(data: bytes, state: MachineState) -> None:
     Byte 6: DCDC 状态
     Byte 7: DCDC 故障码
     """
+    state._dirty = True
     if len(data) < 7: return
 
-    state.water["auxOutletTemp"] = data[0] - 40
-    state.water["auxDcdcTemp"] = data[1] - 40
-    state.water["auxCompTemp"] = data[2] - 40
-    state.h2["separatorPressure"] = data[3]
-    state.temps["dcdcTemp"] = data[4] - 40
-    state.status["dcdcState"] = data[5]
-    state.status["dcdcFaultCode"] = data[6]
+    status = state.status
+    water = state.water
+
+    water.auxOutletTemp = _TEMP_LUT[data[0]]
+    water.auxDcdcTemp = _TEMP_LUT[data[1]]
+    water.auxCompTemp = _TEMP_LUT[data[2]]
+    state.h2.separatorPressure = data[3]
+    state.temps.dcdcTemp = _TEMP_LUT[data[4]]
+    status.dcdcState = data[5]
+    status.dcdcFaultCode = data[6]
 
 
 def parse_msg_7_dcdc_power(data: bytes, state: MachineState) -> None:
@@ -349,13 +489,17 @@ def parse_msg_7_dcdc_power(data: bytes, state: MachineState) -> None:
     Byte 5-6: 输入电压 (0.1V)
     Byte 7-8: 输入电流 (0.1A)
     """
+    state._dirty = True
     if len(data) < 8: return
 
-    # 使用 Big-Endian (>) 解析
-    state.power["dcdcOutVoltage"] = struct.unpack('>H', data[0:2])[0] * 0.1
-    state.power["dcdcOutCurrent"] = struct.unpack('>H', data[2:4])[0] * 0.1
-    state.power["dcdcInVoltage"] = struct.unpack('>H', data[4:6])[0] * 0.1
-    state.power["dcdcInCurrent"] = struct.unpack('>H', data[6:8])[0] * 0.1
+    power = state.power
+
+    # 使用 Big-Endian (>) 一次性解析 4 个字段
+    out_v, out_i, in_v, in_i = _MSG7_DCDC.unpack_from(data, 0)
+    power.dcdcOutVoltage = out_v * 0.1
+    power.dcdcOutCurrent = out_i * 0.1
+    power.dcdcInVoltage = in_v * 0.1
+    power.dcdcInCurrent = in_i * 0.1
 
 
 def parse_msg_8_faults(data: bytes, state: MachineState) -> None:
@@ -363,11 +507,12 @@ def parse_msg_8_faults(data: bytes, state: MachineState) -> None:
     ID: 0x1830A7A4 (周期 200ms) - FCU 主控 8 (故障码)
     Byte 1-8: Fault Code 1 - 8
     """
+    state._dirty = True
     if len(data) < 8: return
     
     # 直接存储原始字节，由前端或上层逻辑解析具体含义
-    for i in range(8):
-        state.faults["codes"][i] = data[i]
+    # 切片一次性写入 8 个故障码 (保持原列表对象不变)
+    state.faults.codes[:] = data[:8]
 
 
 # 消息解析器映射 (ID -> Function)
@@ -382,64 +527,97 @@ MESSAGE_PARSERS = {
     0x1830A7A4: parse_msg_8_faults
 }
 
+_Parser = Callable[[bytes, MachineState], None]
+
+
+def _build_dispatch(parsers: Dict[int, _Parser], shift: int
+                    ) -> Tuple[Callable[[int], Optional[_Parser]], Callable[[int, bytes, MachineState], bool]]:
+    """
+    构建直接索引分发表，返回 (lookup_parser, dispatch)
+
+    parsers 中的 ID 仅在 (ID >> shift) & 0xFF 这一字节上不同，以该字节为下标免去字典哈希；
+    表项为 (完整ID, 解析函数)，查表后再比对完整 ID 以排除其它报文
+    """
+    table: List[Optional[Tuple[int, _Parser]]] = [None] * 256
+    for can_id, parser in parsers.items():
+        table[(can_id >> shift) & 0xFF] = (can_id, parser)
+    assert sum(e is not None for e in table) == len(parsers)  # 下标不得冲突
+
+    def lookup_parser(can_id: int) -> Optional[_Parser]:
+        """按 CAN ID 查表取解析函数，未知 ID 返回 None"""
+        entry = table[(can_id >> shift) & 0xFF]
+        if entry is None or entry[0] != can_id:
+            return None
+        return entry[1]
+
+    def dispatch(can_id: int, data: bytes, state: MachineState) -> bool:
+        """按 CAN ID 查表调用对应解析函数，未知 ID 返回 False"""
+        parser = lookup_parser(can_id)
+        if parser is None:
+            return False
+        parser(data, state)
+        return True
+
+    return lookup_parser, dispatch
+
+
+# MESSAGE_PARSERS 的各 ID 仅在 bit16-23 不同
+lookup_parser, dispatch = _build_dispatch(MESSAGE_PARSERS, 16)
+
+
 def generate_control_packets(control: Dict[str, Any]) -> List[tuple[int, bytes]]:
     """
     生成所有上位机控制报文 (基于 2023.01.10 协议)
     返回格式: [(ID, bytes), (ID, bytes), ...]
     """
     packets = []
+    get = control.get  # 绑定为局部变量，避免重复属性查找
 
     # ==========================================================================
     # 1. 报文 1: 系统控制 & 开关量 (ID: 0x18FF0B27)
     # ==========================================================================
-    data_27 = bytearray(8)
+    data_27 = _TX_BUF_27
     
     # --- Byte 1-3: 手动开关量 (Bit flags) ---
     # 仅在手动模式下有效，这里根据 control['io'] 状态填充
+    # bool 可直接参与位运算，按位组合避免逐位条件分支
     # Byte 1
-    if control.get("h2HighValve", False): data_27[0] |= 0x01
-    if control.get("h2PurgeValve", False): data_27[0] |= 0x02
-    if control.get("h2HeatValve", False): data_27[0] |= 0x04
     # ... (喷射阀 1-4 略，可按需补充 0x08, 0x10, 0x20, 0x40)
-    if control.get("airInletThrottle", False): data_27[0] |= 0x80 # Bit 8
+    byte1 = (bool(get("h2HighValve", False))
+             | bool(get("h2PurgeValve", False)) << 1
+             | bool(get("h2HeatValve", False)) << 2
+             | bool(get("airInletThrottle", False)) << 7)  # Bit 8
     
     # Byte 2
-    if control.get("airOutletThrottle", False): data_27[1] |= 0x01
-    if control.get("bypassValve", False): data_27[1] |= 0x02
-    if control.get("auxFan", False): data_27[1] |= 0x04
-    if control.get("auxPump", False): data_27[1] |= 0x08
-    if control.get("ptcHeater", False): data_27[1] |= 0x10
-    if control.get("h2CircPump", False): data_27[1] |= 0x20
-    if control.get("compressor", False): data_27[1] |= 0x40
-    if control.get("mainPump", False): data_27[1] |= 0x80
+    byte2 = (bool(get("airOutletThrottle", False))
+             | bool(get("bypassValve", False)) << 1
+             | bool(get("auxFan", False)) << 2
+             | bool(get("auxPump", False)) << 3
+             | bool(get("ptcHeater", False)) << 4
+             | bool(get("h2CircPump", False)) << 5
+             | bool(get("compressor", False)) << 6
+             | bool(get("mainPump", False)) << 7)
 
     # Byte 3
     # ... (主散热风扇 1-6, 节温器等标志位)
-    if control.get("dcdcPrecharge", False): data_27[2] |= 0x80 # Bit 24
+    byte3 = bool(get("dcdcPrecharge", False)) << 7  # Bit 24
 
     # --- Byte 5-6: 目标电流 (Little-Endian) ---
     # 0.1A/bit
-    target_current = int(control.get("stackTargetCurrent", 0) * 10)
-    struct.pack_into('<H', data_27, 4, target_current)
+    target_current = int(get("stackTargetCurrent", 0) * 10)
 
     # --- Byte 7: 模式与指令 (核心控制) ---
     # Bit 56-55: 工作模式 (00=手动, 11=自动)
-    mode_bits = 0x03 if control.get("mode") == "AUTO" else 0x00
+    # 查表的键均为字符串: 非字符串 (含列表/字典等不可哈希的取值) 按 0 处理
+    mode = get("mode")
+    mode_bits = _MODE_BITS.get(mode, 0x00) if isinstance(mode, str) else 0x00
     
     # Bit 54-53: 状态指令 (00=关机, 11=启动, 01=复位, 10=急停)
-    cmd_str = control.get("command", "NONE")
-    cmd_bits = 0x00 # 默认为关机/无操作
-    if cmd_str == "START":
-        cmd_bits = 0x03 # Binary 11
-    elif cmd_str == "RESET":
-        cmd_bits = 0x01 # Binary 01
-    elif cmd_str == "EMERGENCY_STOP":
-        cmd_bits = 0x02 # Binary 10
-    elif cmd_str == "STOP":
-        cmd_bits = 0x00 # Binary 00
+    cmd_str = get("command", "NONE")
+    cmd_bits = _CMD_BITS.get(cmd_str, 0x00) if isinstance(cmd_str, str) else 0x00 # 默认为关机/无操作
     
     # Bit 50-49: DCDC控制 (0=停止, 1=启动, 2=放电)
-    dcdc_bits = control.get("dcdcCommand", 0) & 0x03
+    dcdc_bits = get("dcdcCommand", 0) & 0x03
 
     # 组合 Byte 7
     # 模式在最高2位 (bit 7-6 of the byte, corresponding to 56-55 in protocol)
@@ -448,47 +626,48 @@ def generate_control_packets(control: Dict[str, Any]) -> List[tuple[int, bytes]]
     # 修正位移：
     # Byte7: [7:6]=Mode, [5:4]=Cmd, [3:2]=Reserved, [1:0]=DCDC
     byte7_val = (mode_bits << 6) | (cmd_bits << 4) | (dcdc_bits << 1) # 假设DCDC是bit 1-2
-    data_27[6] = byte7_val
+
+    # 8 字节整帧一次写入 (Byte 4/8 保留为 0)
+    _CTRL27.pack_into(data_27, 0, byte1, byte2, byte3, target_current, byte7_val)
 
     packets.append((0x18FF0B27, bytes(data_27)))
 
     # ==========================================================================
     # 2. 报文 2: 执行器设定值 (ID: 0x18FF0B28)
     # ==========================================================================
-    data_28 = bytearray(8)
+    data_28 = _TX_BUF_28
     
     # Byte 1: 进气节气门 (0-100%)
-    data_28[0] = int(control.get("airInletThrottlePos", 0))
+    inlet_throttle = int(get("airInletThrottlePos", 0))
     # Byte 2: 尾排节气门
-    data_28[1] = int(control.get("airOutletThrottlePos", 0))
-    
+    outlet_throttle = int(get("airOutletThrottlePos", 0))
     # Byte 3-4: 空压机转速 (Little-Endian)
-    comp_speed = int(control.get("compressorTargetSpeed", 0))
-    struct.pack_into('<H', data_28, 2, comp_speed)
-    
+    comp_speed = int(get("compressorTargetSpeed", 0))
     # Byte 5: 水泵转速 (0-100%)
-    data_28[4] = int(control.get("mainPumpSpeed", 0))
+    pump_speed = int(get("mainPumpSpeed", 0))
     # Byte 6: 节温器 (7-92%)
-    data_28[5] = int(control.get("thermostatPos", 0))
-    
+    thermostat = int(get("thermostatPos", 0))
     # Byte 7-8: 氢循泵转速 (Little-Endian)
-    h2_pump_speed = int(control.get("h2PumpTargetSpeed", 0))
-    struct.pack_into('<H', data_28, 6, h2_pump_speed)
+    h2_pump_speed = int(get("h2PumpTargetSpeed", 0))
+
+    # 8 字节整帧一次写入
+    _CTRL28.pack_into(data_28, 0, inlet_throttle, outlet_throttle, comp_speed,
+                      pump_speed, thermostat, h2_pump_speed)
 
     packets.append((0x18FF0B28, bytes(data_28)))
 
     # ==========================================================================
     # 3. 报文 6: DCDC参数 (ID: 0x18FF0B32)
     # ==========================================================================
-    data_32 = bytearray(8)
+    data_32 = _TX_BUF_32
     
     # Byte 4-5: 输出电压 (Big-Endian per doc!)
-    dcdc_volt = int(control.get("dcdcTargetVoltage", 0) * 10)
-    struct.pack_into('>H', data_32, 3, dcdc_volt) # pack into index 3,4
-    
+    dcdc_volt = int(get("dcdcTargetVoltage", 0) * 10)
     # Byte 6-7: 输入限流 (Big-Endian per doc!)
-    dcdc_limit = int(control.get("dcdcInputLimit", 0) * 10)
-    struct.pack_into('>H', data_32, 5, dcdc_limit) # pack into index 5,6
+    dcdc_limit = int(get("dcdcInputLimit", 0) * 10)
+
+    # 整帧写入: index 0-2 与 7 为保留 0, index 3-4 电压, index 5-6 限流
+    _CTRL32.pack_into(data_32, 0, dcdc_volt, dcdc_limit)
 
     packets.append((0x18FF0B32, bytes(data_32)))
 
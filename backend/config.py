@@ -2,38 +2,54 @@
 Configuration for CAN Backend Server
 """
 
+from typing import Dict, Final
+
 # CAN Interface Selection
 # Options: "zlg" (Hardware), "virtual" (Simulation)
-CAN_INTERFACE_TYPE = "virtual"
+CAN_INTERFACE_TYPE: Final[str] = "virtual"
 
 # ZLG USB-CAN Device Configuration
 # Device Type (for USBCAN devices):
 #   USBCAN1 = 3
 #   USBCAN2 = 4  
-CANALYST_DEVICE_TYPE = 4  # USBCAN2
+CANALYST_DEVICE_TYPE: Final[int] = 4  # USBCAN2
 
 # Device Index: 0 for first device, 1 for second, etc.
-CANALYST_DEVICE_INDEX = 0
+CANALYST_DEVICE_INDEX: Final[int] = 0
 
 # CAN Channel: 0 or 1
-CANALYST_CHANNEL = 0
+CANALYST_CHANNEL: Final[int] = 0
 
 # CAN Bitrate (must match your FCU configuration)
-CAN_BITRATE = 250000
+CAN_BITRATE: Final[int] = 250000
 
 # WebSocket Server Configuration
-WEBSOCKET_HOST = "0.0.0.0"  # Listen on all interfaces
-WEBSOCKET_PORT = 8765
+WEBSOCKET_HOST: Final[str] = "0.0.0.0"  # Listen on all interfaces
+WEBSOCKET_PORT: Final[int] = 8765
+# 单连接发送缓冲上限 (字节): 超过时广播跳过该客户端，慢客户端只会丢帧而不会无限堆积
+WEBSOCKET_WRITE_LIMIT: Final[int] = 2**16
 
 # CAN Message IDs (matching frontend protocol)
-CAN_RX_IDS = {
+CAN_RX_IDS: Final[Dict[int, str]] = {
     0x18FF01F0: "status",      # 系统状态
     0x18FF02F0: "power",       # 功率数据
     0x18FF03F0: "sensors",     # 传感器数据
     0x18FF04F0: "io",          # IO状态
 }
 
-CAN_TX_ID = 0x18FF10A0  # 控制命令
+CAN_TX_ID: Final[int] = 0x18FF10A0  # 控制命令
+
+# CAN 接收积压处理: 单次轮询收到的帧数超过该值时，同一 ID 仅解析最新一帧
+# (解析函数均为覆盖写入状态，积压的中间帧不影响最终结果)
+CAN_RX_COALESCE_THRESHOLD: Final[int] = 8
+
+# CAN 单次轮询最大帧数，以及总线空闲时的轮询退避区间 (秒)
+# 有数据时立即继续读取；连续空轮询时休眠时间从最小值起逐次翻倍，直到最大值
+CAN_RX_BATCH_SIZE: Final[int] = 100
+CAN_RX_IDLE_SLEEP_MIN_S: Final[float] = 0.001
+CAN_RX_IDLE_SLEEP_MAX_S: Final[float] = 0.01
 
 # Update rate (Hz) for broadcasting machine state
-BROADCAST_RATE = 10  # 10 Hz = 100ms interval
+BROADCAST_RATE: Final[int] = 10  # 10 Hz = 100ms interval
+# 广播周期 (秒)，在此处一次性换算，使用方无需再做除法
+BROADCAST_INTERVAL_S: Final[float] = 1.0 / BROADCAST_RATE
@@ -4,15 +4,20 @@ Uses EnhancedMSTGAT (CEO-QAAdamW) deep learning model for fault classification
 """
 
 import os
-import json
 import math
 import logging
 import threading
+import time
 import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Deque, Dict, Tuple, Optional, Any
 from dataclasses import dataclass, field
 
+# JSON 编解码与 server 共用 can_protocol 中的实现 (orjson 可选，未安装时回退到标准库 json)
+from can_protocol import _json_dumps, _json_loads
+
 logger = logging.getLogger(__name__)
 
 # ================== TensorFlow 导入 ==================
@@ -489,8 +494,12 @@ class OnlineDiagnosis:
         self.model = None
         self.is_trained = False
         self.sample_count = 0
-        self.feedback_samples: List[Dict] = []
+        # 仅保留最近 100 条反馈样本 (deque 定长，追加时自动淘汰最旧记录)
+        self.feedback_samples: Deque[Dict] = deque(maxlen=100)
         self._feedback_lock = threading.Lock()
+        # 反馈文件写入放到单线程后台执行，避免阻塞 asyncio 事件循环；close() 时等待写完
+        self._save_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='diag-save')
+        self._unsaved = False   # 是否有尚未提交写入的反馈样本
         self._predict_interval = 0.5  # seconds between predictions
         self._last_predict_time = 0.0
 
@@ -504,6 +513,13 @@ class OnlineDiagnosis:
             0.132746038, 9.58184703, 4.40340010, 4.09520911, 
             0.417523187, 6.35361892, 0.0242430148
         ])
+        # 预计算倒数，标准化时用乘法代替除法
+        self._scaler_inv_scale = 1.0 / self.scaler_scale
+
+        # 特征/标准化缓冲区预分配，每次推理原地填充，避免重复分配数组
+        self._feat_buf = np.empty(7, dtype=np.float32)
+        self._feat_X = self._feat_buf.reshape(1, -1)   # 共享内存的 (1, 7) 视图
+        self._X_scaled = np.empty((1, 7), dtype=np.float64)
 
         # 加载模型
         self._initialize()
@@ -531,15 +547,15 @@ class OnlineDiagnosis:
             self.is_trained = True
             logger.info(f"✓ EnhancedMSTGAT 模型加载成功 (参数量: {self.model.count_params():,})")
 
+            # 预热: 以与 predict 相同的形状/类型调用一次模型，
+            # 把首次调用的图构建开销移到启动阶段，避免首个实时诊断出现延迟尖峰
+            try:
+                self.model(np.zeros_like(self._X_scaled), training=False)
+            except Exception as e:
+                logger.warning(f"模型预热失败 (不影响后续推理): {e}")
+
             # 加载反馈数据计数
-            if os.path.exists(self.data_path):
-                try:
-                    with open(self.data_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        self.sample_count = data.get("sample_count", 0)
-                        self.feedback_samples = data.get("samples", [])[-100:]
-                except Exception:
-                    pass
+            self._load_feedback()
 
         except Exception as e:
             logger.error(f"加载 EnhancedMSTGAT 模型失败: {e}")
@@ -548,6 +564,18 @@ class OnlineDiagnosis:
             self.model = None
             self.is_trained = False
 
+    def _load_feedback(self):
+        """读取已保存的反馈文件 (deque 定长，只保留最近 100 条样本)"""
+        if not os.path.exists(self.data_path):
+            return
+        try:
+            with open(self.data_path, 'rb') as f:
+                data = _json_loads(f.read())
+            self.sample_count = data.get("sample_count", 0)
+            self.feedback_samples.extend(data.get("samples", []))
+        except Exception:
+            pass
+
     def extract_features(self, machine_state: Dict) -> Optional[np.ndarray]:
         """
         从机器状态提取特征向量
@@ -556,23 +584,22 @@ class OnlineDiagnosis:
             machine_state: MachineState字典
 
         Returns:
-            特征向量 shape (7,)
+            特征向量 shape (7,)，为内部复用的缓冲区，需要保留时请复制 (如 tolist())
         """
         try:
             power = machine_state.get("power", {})
             sensors = machine_state.get("sensors", {})
 
-            features = [
-                power.get("stackVoltage", 0.0),           # U_totV
-                sensors.get("stackTemp", 25.0),           # T_Stack_inlet
-                power.get("stackPower", 0.0),             # PW
-                sensors.get("h2Concentration", 0.0),      # RH_H2
-                sensors.get("airInletTemp", 30.4),        # T_Air_inlet (定值替代默认 30.4)
-                sensors.get("ambientTemp", 25.0),         # T_3 (环境温度)
-                sensors.get("airFlow", 6.18)              # m_Air (定值替代默认 6.18)
-            ]
+            buf = self._feat_buf
+            buf[0] = power.get("stackVoltage", 0.0)           # U_totV
+            buf[1] = sensors.get("stackTemp", 25.0)           # T_Stack_inlet
+            buf[2] = power.get("stackPower", 0.0)             # PW
+            buf[3] = sensors.get("h2Concentration", 0.0)      # RH_H2
+            buf[4] = sensors.get("airInletTemp", 30.4)        # T_Air_inlet (定值替代默认 30.4)
+            buf[5] = sensors.get("ambientTemp", 25.0)         # T_3 (环境温度)
+            buf[6] = sensors.get("airFlow", 6.18)             # m_Air (定值替代默认 6.18)
 
-            return np.array(features, dtype=np.float32)
+            return buf
 
         except Exception as e:
             logger.error(f"特征提取失败: {e}")
@@ -596,6 +623,13 @@ class OnlineDiagnosis:
                 "timestamp": int
             }
         """
+        # 节流判断放在最前，间隔内直接复用上次结果，不构建新的结果字典
+        # (间隔使用单调时钟，不受系统时间调整影响)
+        now = time.monotonic()
+        throttled = now - self._last_predict_time < self._predict_interval
+        if throttled and hasattr(self, '_last_result'):
+            return self._last_result
+
         result = {
             "label": "normal",
             "label_cn": "正常",
@@ -603,19 +637,18 @@ class OnlineDiagnosis:
             "probabilities": {},
             "is_trained": self.is_trained,
             "sample_count": self.sample_count,
-            "timestamp": int(datetime.now().timestamp() * 1000)
+            "timestamp": time.time_ns() // 1_000_000   # Unix 毫秒
         }
 
-        now = datetime.now().timestamp()
-        if now - self._last_predict_time < self._predict_interval:
-            if hasattr(self, '_last_result'):
-                return self._last_result
+        if throttled:
             return result
         self._last_predict_time = now
 
         if not TF_AVAILABLE or self.model is None:
-            # 回退到规则诊断
-            return self._rule_based_diagnosis(machine_state, result)
+            # 回退到规则诊断 (结果同样缓存，节流间隔内直接复用)
+            result = self._rule_based_diagnosis(machine_state, result)
+            self._last_result = result
+            return result
 
         # 提取特征
         features = self.extract_features(machine_state)
@@ -623,9 +656,10 @@ class OnlineDiagnosis:
             return result
 
         try:
-            # 标准化
-            X = features.reshape(1, -1)
-            X_scaled = (X - self.scaler_mean) / self.scaler_scale
+            # 标准化 (在预分配缓冲区上原地计算; _feat_X 与 features 共享内存)
+            X_scaled = self._X_scaled
+            np.subtract(self._feat_X, self.scaler_mean, out=X_scaled)
+            X_scaled *= self._scaler_inv_scale
 
             # 模型推理（TensorFlow 模型预测）
             probas = self.model(X_scaled, training=False)
@@ -722,20 +756,21 @@ class OnlineDiagnosis:
                 "timestamp": datetime.now().isoformat(),
                 "features": features.tolist(),
                 "label": label,
+                # 复制一份: MachineState.to_dict 返回的字典会被原地更新
                 "machine_state_snapshot": {
-                    "power": machine_state.get("power", {}),
-                    "sensors": machine_state.get("sensors", {}),
+                    "power": dict(machine_state.get("power", {})),
+                    "sensors": dict(machine_state.get("sensors", {})),
                 }
             }
             self.feedback_samples.append(sample_record)
-            if len(self.feedback_samples) > 100:
-                self.feedback_samples = self.feedback_samples[-100:]
 
             self.sample_count += 1
+            self._unsaved = True
 
-            # 每10个样本保存一次
+            # 每10个样本保存一次 (后台线程写入)
             if self.sample_count % 10 == 0:
-                self._save_feedback()
+                self._save_pool.submit(self._write_feedback, self._feedback_payload())
+                self._unsaved = False
 
             logger.info(f"✓ 反馈已记录: 标签={label}, 累计样本={self.sample_count}")
             return True
@@ -744,16 +779,25 @@ class OnlineDiagnosis:
             logger.error(f"保存反馈失败: {e}")
             return False
 
+    def _feedback_payload(self) -> Dict:
+        """在调用线程中生成待保存数据的快照 (样本记录创建后不再修改，浅复制即可)"""
+        return {
+            "sample_count": self.sample_count,
+            "samples": list(self.feedback_samples),
+            "last_update": datetime.now().isoformat()
+        }
+
     def _save_feedback(self):
-        """保存反馈数据到文件（线程安全）"""
+        """同步保存反馈数据到文件"""
+        self._write_feedback(self._feedback_payload())
+
+    def _write_feedback(self, payload: Dict):
+        """将反馈快照写入文件（线程安全，可在后台线程执行）"""
         with self._feedback_lock:
             try:
+                text = _json_dumps(payload, indent=True)
                 with open(self.data_path, 'w', encoding='utf-8') as f:
-                    json.dump({
-                        "sample_count": self.sample_count,
-                        "samples": self.feedback_samples,
-                        "last_update": datetime.now().isoformat()
-                    }, f, indent=2, ensure_ascii=False)
+                    f.write(text)
                 logger.info(f"✓ 反馈数据已保存: {self.data_path}")
             except Exception as e:
                 logger.error(f"保存反馈数据失败: {e}")
@@ -762,6 +806,13 @@ class OnlineDiagnosis:
         """保存反馈数据（兼容旧接口）"""
         self._save_feedback()
 
+    def close(self):
+        """写入尚未保存的反馈样本，等待后台排队的写入完成并关闭写入线程"""
+        if self._unsaved:
+            self._save_pool.submit(self._write_feedback, self._feedback_payload())
+            self._unsaved = False
+        self._save_pool.shutdown(wait=True)
+
     def get_status(self) -> Dict:
         """获取诊断器状态"""
         return {
@@ -6,12 +6,14 @@ Reads CAN data from ZLG USB-CAN interface via ControlCAN.dll and forwards to fro
 import asyncio
 import json
 import logging
+import struct
 import time
 import os
 import sys
 import ctypes
-from ctypes import Structure, c_uint, c_ubyte, c_ushort, POINTER, byref
-from typing import Set, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from ctypes import Structure, c_int, c_uint, c_ubyte, c_ushort, POINTER, byref
+from typing import Dict, Set, Optional
 
 import websockets
 from websockets.server import WebSocketServerProtocol
@@ -19,10 +21,12 @@ from websockets.server import WebSocketServerProtocol
 from config import (
     CANALYST_DEVICE_TYPE, CANALYST_DEVICE_INDEX, CANALYST_CHANNEL,
     CAN_BITRATE, WEBSOCKET_HOST, WEBSOCKET_PORT,
-    CAN_TX_ID, BROADCAST_RATE
+    CAN_TX_ID, BROADCAST_INTERVAL_S, CAN_RX_COALESCE_THRESHOLD, WEBSOCKET_WRITE_LIMIT,
+    CAN_RX_BATCH_SIZE, CAN_RX_IDLE_SLEEP_MIN_S, CAN_RX_IDLE_SLEEP_MAX_S
 )
+from can_protocol import _json_dumps, _json_loads
 from can_protocol1 import (
-    MachineState, MESSAGE_PARSERS, generate_control_packets
+    MachineState, MESSAGE_PARSERS, lookup_parser, generate_control_packets
 )
 
 # 诊断模块
@@ -33,6 +37,13 @@ except ImportError as e:
     DIAGNOSIS_AVAILABLE = False
     print(f"警告: 诊断模块加载失败: {e}")
 
+# uvloop 事件循环 (可选，仅 Linux/macOS；Windows 下回退到默认 asyncio 循环)
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -70,6 +81,11 @@ class VCI_CAN_OBJ_ARRAY(Structure):
         self.SIZE = num_of_structs
         self.ADDR = self.STRUCT_ARRAY[0]
 
+# VCI_CAN_OBJ 的字节布局 (ID, 跳过 TimeStamp 与 4 个标志字节, DataLen, Data, 跳过 Reserved)，
+# 用于从接收缓冲的原始字节整批解包，免去逐帧的 ctypes 结构体代理和字段访问
+_VCI_OBJ_LAYOUT = struct.Struct('<I8xB8s3x')
+assert _VCI_OBJ_LAYOUT.size == ctypes.sizeof(VCI_CAN_OBJ)
+
 # Baud Rate Setup (Timing0, Timing1)
 BAUD_RATE_MAP = {
     10000:   (0x31, 0x1C),
@@ -87,15 +103,43 @@ BAUD_RATE_MAP = {
     1000000: (0x00, 0x14),
 }
 
+# 各波特率对应的初始化配置，模块加载时一次性构造
+# Config: AccCode=0x80000008, AccMask=0xFFFFFFFF (Accept All)
+BAUD_CONFIGS = {
+    rate: VCI_INIT_CONFIG(0x80000008, 0xFFFFFFFF, 0, 0, t0, t1, 0)
+    for rate, (t0, t1) in BAUD_RATE_MAP.items()
+}
+
 import math
 import random
 from abc import ABC, abstractmethod
+from array import array
 
 from config import CAN_INTERFACE_TYPE
 
+class RxBatch:
+    """接收批缓冲 (结构数组): 驱动按帧号写入，跨轮询复用，避免逐帧分配 dict/bytearray"""
+    __slots__ = ('n', 'ids', 'lens', 'data', '_view')
+
+    def __init__(self, size: int):
+        self.n = 0                          # 本次轮询有效帧数
+        self.ids = array('I', [0]) * size   # 仲裁 ID
+        self.lens = bytearray(size)         # 数据长度 (DLC)
+        self.data = bytearray(8 * size)     # 数据区，每帧固定 8 字节
+        self._view = memoryview(self.data)
+
+    def frame(self, i: int) -> memoryview:
+        """第 i 帧数据的零拷贝视图，仅在下次 receive 之前有效"""
+        off = i * 8
+        return self._view[off:off + self.lens[i]]
+
+
 class CANDriver(ABC):
     """Abstract base class for CAN drivers"""
     
+    # receive 是否为阻塞式 DLL 调用 (True 时在工作线程中执行，避免卡住事件循环)
+    BLOCKING_RECEIVE = False
+    
     @abstractmethod
     def open(self) -> bool:
         pass
@@ -113,17 +157,39 @@ class CANDriver(ABC):
         pass
         
     @abstractmethod
-    def receive(self, batch_size=100) -> List[Dict]:
+    def receive(self, batch_size=100) -> RxBatch:
+        """读取一批报文，返回驱动内复用的 RxBatch (batch.n 为帧数)"""
         pass
         
     @abstractmethod
     def send(self, arbitration_id, data, is_extended=True) -> bool:
         pass
 
+    def send_batch(self, frames, is_extended=True) -> int:
+        """按顺序发送多帧 [(arbitration_id, data), ...]，返回成功发送的帧数 (遇到失败即停止)
+
+        一条控制命令生成的多帧属于同一次写入 (模式/指令帧在前，设定值帧在后)。
+        前面的帧发送失败后不再继续发送后续帧: 避免控制器只收到一部分设定值，
+        而未收到与之配套的模式/指令；此时控制器保持上一条完整命令的状态，
+        调用方按返回值逐帧记录失败，由界面重新下发整条命令。
+        """
+        sent = 0
+        for arbitration_id, data in frames:
+            if not self.send(arbitration_id, data, is_extended):
+                break
+            sent += 1
+        return sent
+
 
 class VirtualDriver(CANDriver):
     """Virtual CAN driver for simulation and testing"""
     
+    # 模拟报文布局 (小端，每帧 8 字节)
+    _FRAME_STATUS = struct.Struct('<BB6x')
+    _FRAME_POWER = struct.Struct('<HHHH')
+    _FRAME_SENSORS = struct.Struct('<hhH2x')
+    _FRAME_IO = struct.Struct('<BBhH2x')
+    
     def __init__(self):
         self.running = False
         self.start_time = time.time()
@@ -131,6 +197,10 @@ class VirtualDriver(CANDriver):
         self.update_interval = 0.1 # 100ms
         self.io_flags = 0  # Store simulated IO state
         self.fan1_duty = 0
+        self._batch = RxBatch(4)  # 每周期固定 4 帧
+        for i, can_id in enumerate((0x18FF01F0, 0x18FF02F0, 0x18FF03F0, 0x18FF04F0)):
+            self._batch.ids[i] = can_id
+            self._batch.lens[i] = 8
         logger.info("Initialized Virtual CAN Driver")
         
     def open(self) -> bool:
@@ -150,24 +220,27 @@ class VirtualDriver(CANDriver):
         self.running = False
         logger.info("Virtual CAN Closed")
         
-    def receive(self, batch_size=100) -> List[Dict]:
+    def receive(self, batch_size=100) -> RxBatch:
         """Generate fake CAN messages"""
+        batch = self._batch
+        batch.n = 0
         if not self.running:
-            return []
+            return batch
             
         current_time = time.time()
         if current_time - self.last_send_time < self.update_interval:
-            return []
+            return batch
             
         self.last_send_time = current_time
-        messages = []
         elapsed = current_time - self.start_time
         
+        # 各帧直接 pack 进批缓冲 (帧号/ID/长度在 __init__ 中固定)，不再生成临时 bytearray
+        buf = batch.data
+        
         # 1. Heartbeat (0x18FF01F0)
         # Byte 0: Counter, Byte 1: Status=2(RUN)
         hb_counter = int(elapsed * 10) % 256
-        data_status = bytes([hb_counter, 0x02, 0, 0, 0, 0, 0, 0])
-        messages.append(self._create_msg(0x18FF01F0, data_status))
+        self._FRAME_STATUS.pack_into(buf, 0, hb_counter, 0x02)
         
         # 2. Power Data (0x18FF02F0)
         # Sine wave simulation for voltage/current
@@ -176,45 +249,23 @@ class VirtualDriver(CANDriver):
         stack_i = int(2000 + 1000 * math.sin(elapsed * 0.3)) # 200A +/- 100A
         dcf_v = 2400 # 24.0V
         dcf_i = int((stack_v * 0.01 * stack_i * 0.1 * 0.95) / (dcf_v * 0.01) * 10) # Calc based on power
-        
-        data_power = bytearray(8)
-        data_power[0:2] = stack_v.to_bytes(2, 'little')
-        data_power[2:4] = stack_i.to_bytes(2, 'little')
-        data_power[4:6] = dcf_v.to_bytes(2, 'little')
-        data_power[6:8] = dcf_i.to_bytes(2, 'little')
-        messages.append(self._create_msg(0x18FF02F0, data_power))
+        self._FRAME_POWER.pack_into(buf, 8, stack_v, stack_i, dcf_v, dcf_i)
         
         # 3. Sensors (0x18FF03F0)
         # Temp: 60C + 5 sin(t) -> (60+40)*10 = 1000
+        # Stack Temp, Ambient (25+40)*10, H2 Cyl Press 1200*0.01 = 12MPa
         temp = int((60 + 5 * math.sin(elapsed * 0.1) + 40) * 10)
-        data_sensors = bytearray(8)
-        data_sensors[0:2] = temp.to_bytes(2, 'little', signed=True) # Stack Temp
-        data_sensors[2:4] = int((25+40)*10).to_bytes(2, 'little', signed=True) # Ambient
-        data_sensors[4:6] = int(1200).to_bytes(2, 'little') # H2 Cyl Press 1200*0.01 = 12MPa
-        messages.append(self._create_msg(0x18FF03F0, data_sensors))
+        self._FRAME_SENSORS.pack_into(buf, 16, temp, (25 + 40) * 10, 1200)
 
         # 4. IO Status (0x18FF04F0)
         # Byte 0: IO Flags
         # Byte 1: Fan1 Duty
-        # Byte 2-3: DCF MOS Temp
-        # Byte 4-5: Fault Code
-        dcf_mos_temp = int((45 + 40) * 10) # 45 C
-        data_io = bytearray(8)
-        data_io[0] = self.io_flags
-        data_io[1] = self.fan1_duty
-        data_io[2:4] = dcf_mos_temp.to_bytes(2, 'little', signed=True)
-        data_io[4:6] = (0).to_bytes(2, 'little') # No fault
-        messages.append(self._create_msg(0x18FF04F0, data_io))
-        
-        return messages
-        
-    def _create_msg(self, arbitration_id, data):
-        return {
-            'arbitration_id': arbitration_id,
-            'data': bytearray(data),
-            'is_extended_id': True,
-            'timestamp': int(time.time() * 1000)
-        }
+        # Byte 2-3: DCF MOS Temp = (45+40)*10 (45 C)
+        # Byte 4-5: Fault Code = 0 (No fault)
+        self._FRAME_IO.pack_into(buf, 24, self.io_flags, self.fan1_duty, (45 + 40) * 10, 0)
+        
+        batch.n = 4
+        return batch
         
     def send(self, arbitration_id, data, is_extended=True) -> bool:
         logger.info(f"[VirtualTX] ID: 0x{arbitration_id:08X} Data: {data.hex()}")
@@ -263,12 +314,23 @@ class VirtualDriver(CANDriver):
 class ZLGDriver(CANDriver):
     """Wrapper for ZLG ControlCAN.dll"""
     
+    RX_CAPACITY = 100  # 单次 VCI_Receive 最大帧数
+    TX_CAPACITY = 8    # 单次 VCI_Transmit 最大帧数
+    BLOCKING_RECEIVE = True
+    
     def __init__(self, device_type=4, device_index=0, channel=0):
         self.device_type = device_type
         self.device_index = device_index
         self.channel = channel
         self.dll = None
         self.is_open = False
+        # 接收缓冲按最大批量预分配一次，跨轮询复用
+        self._rx_buffer = VCI_CAN_OBJ_ARRAY(self.RX_CAPACITY)
+        # 同一块接收缓冲的原始字节视图 (依赖 _rx_buffer 保持存活)
+        self._rx_raw = memoryview((c_ubyte * (_VCI_OBJ_LAYOUT.size * self.RX_CAPACITY)).from_address(
+            ctypes.addressof(self._rx_buffer.ADDR)))
+        self._batch = RxBatch(self.RX_CAPACITY)
+        self._tx_objs = (VCI_CAN_OBJ * self.TX_CAPACITY)()  # 发送帧同样复用
         self._load_dll()
         
     def _load_dll(self):
@@ -290,6 +352,7 @@ class ZLGDriver(CANDriver):
                     
                 logger.info(f"Loading DLL from: {dll_path}")
                 self.dll = ctypes.windll.LoadLibrary(dll_path)
+                self._set_prototypes()
                 logger.info("ControlCAN.dll loaded successfully")
                 
             except Exception as e:
@@ -299,70 +362,73 @@ class ZLGDriver(CANDriver):
             logger.error("ZLGDriver only supports Windows")
             raise NotImplementedError("Windows only")
 
+    def _set_prototypes(self):
+        """声明 DLL 函数原型，省去 ctypes 每次调用时的参数类型推断"""
+        # 返回值按有符号处理: 出错时部分设备返回 0xFFFFFFFF (-1)
+        dll = self.dll
+        dll.VCI_OpenDevice.argtypes = [c_uint, c_uint, c_uint]
+        dll.VCI_CloseDevice.argtypes = [c_uint, c_uint]
+        dll.VCI_InitCAN.argtypes = [c_uint, c_uint, c_uint, POINTER(VCI_INIT_CONFIG)]
+        dll.VCI_StartCAN.argtypes = [c_uint, c_uint, c_uint]
+        dll.VCI_Transmit.argtypes = [c_uint, c_uint, c_uint, POINTER(VCI_CAN_OBJ), c_uint]
+        dll.VCI_Receive.argtypes = [c_uint, c_uint, c_uint, POINTER(VCI_CAN_OBJ), c_uint, c_int]
+        for func in (dll.VCI_OpenDevice, dll.VCI_CloseDevice, dll.VCI_InitCAN,
+                     dll.VCI_StartCAN, dll.VCI_Transmit, dll.VCI_Receive):
+            func.restype = c_int
+
     def open(self) -> bool:
         if self.is_open:
             return True
         
-        print(f"[DEBUG] Attempting to open ZLG device (Type={self.device_type}, Index={self.device_index})...", flush=True)
         logger.info(f"Attempting to open ZLG device (Type={self.device_type}, Index={self.device_index})")
         
         ret = self.dll.VCI_OpenDevice(self.device_type, self.device_index, 0)
         
         if ret == 1:
-            print("[SUCCESS] VCI_OpenDevice succeeded!", flush=True)
             logger.info("VCI_OpenDevice succeeded")
             self.is_open = True
             return True
         else:
-            print(f"[FAILED] VCI_OpenDevice failed. Return code: {ret}", flush=True)
-            print("[INFO] Possible reasons:", flush=True)
-            print("  1. USB-CAN adapter not connected", flush=True)
-            print("  2. Driver not installed correctly", flush=True)
-            print("  3. Device occupied by another program", flush=True)
-            print("  4. Wrong device type in config.py", flush=True)
-            logger.error(f"VCI_OpenDevice failed. Return code: {ret}")
+            logger.error("VCI_OpenDevice failed. Return code: %s. Possible reasons:\n"
+                         "  1. USB-CAN adapter not connected\n"
+                         "  2. Driver not installed correctly\n"
+                         "  3. Device occupied by another program\n"
+                         "  4. Wrong device type in config.py", ret)
             return False
 
     def init_can(self, bitrate: int) -> bool:
         if not self.is_open:
-            print("[ERROR] Cannot init CAN: device not open", flush=True)
+            logger.error("Cannot init CAN: device not open")
             return False
             
-        if bitrate not in BAUD_RATE_MAP:
-            print(f"[ERROR] Unsupported bitrate: {bitrate}", flush=True)
+        config = BAUD_CONFIGS.get(bitrate)
+        if config is None:
             logger.error(f"Unsupported bitrate: {bitrate}")
             return False
             
-        t0, t1 = BAUD_RATE_MAP[bitrate]
-        print(f"[DEBUG] Initializing CAN (Channel={self.channel}, Bitrate={bitrate}, T0=0x{t0:02X}, T1=0x{t1:02X})...", flush=True)
-        
-        # Config: AccCode=0x80000008, AccMask=0xFFFFFFFF (Accept All)
-        config = VCI_INIT_CONFIG(0x80000008, 0xFFFFFFFF, 0, 0, t0, t1, 0)
+        logger.debug("Initializing CAN (Channel=%s, Bitrate=%s, T0=0x%02X, T1=0x%02X)",
+                     self.channel, bitrate, config.Timing0, config.Timing1)
         
         ret = self.dll.VCI_InitCAN(self.device_type, self.device_index, self.channel, byref(config))
         if ret == 1:
-            print(f"[SUCCESS] VCI_InitCAN succeeded (Channel {self.channel}, Bitrate {bitrate})", flush=True)
             logger.info(f"VCI_InitCAN channel {self.channel} succeeded (Bitrate: {bitrate})")
             return True
         else:
-            print(f"[FAILED] VCI_InitCAN failed. Return code: {ret}", flush=True)
             logger.error(f"VCI_InitCAN failed. Return code: {ret}")
             return False
 
     def start(self) -> bool:
         if not self.is_open:
-            print("[ERROR] Cannot start CAN: device not open", flush=True)
+            logger.error("Cannot start CAN: device not open")
             return False
         
-        print(f"[DEBUG] Starting CAN (Channel={self.channel})...", flush=True)
+        logger.debug("Starting CAN (Channel=%s)", self.channel)
         ret = self.dll.VCI_StartCAN(self.device_type, self.device_index, self.channel)
         
         if ret == 1:
-            print("[SUCCESS] VCI_StartCAN succeeded! CAN bus is ACTIVE.", flush=True)
-            logger.info("VCI_StartCAN succeeded")
+            logger.info("VCI_StartCAN succeeded! CAN bus is ACTIVE.")
             return True
         else:
-            print(f"[FAILED] VCI_StartCAN failed. Return code: {ret}", flush=True)
             logger.error(f"VCI_StartCAN failed. Return code: {ret}")
             return False
 
@@ -372,54 +438,80 @@ class ZLGDriver(CANDriver):
             self.is_open = False
             logger.info("Device closed")
 
-    def receive(self, batch_size=100) -> List[Dict]:
+    def receive(self, batch_size=100) -> RxBatch:
+        batch = self._batch
+        batch.n = 0
         if not self.is_open:
-            return []
+            return batch
             
-        rx_buffer = VCI_CAN_OBJ_ARRAY(batch_size)
+        batch_size = min(batch_size, self.RX_CAPACITY)
+        rx_buffer = self._rx_buffer
         num_frames = self.dll.VCI_Receive(self.device_type, self.device_index, self.channel, 
                                         byref(rx_buffer.ADDR), batch_size, 0)
         
-        messages = []
         if num_frames > 0:
-            for i in range(num_frames):
-                obj = rx_buffer.STRUCT_ARRAY[i]
-                is_extended = (obj.ExternFlag == 1)
-                messages.append({
-                    'arbitration_id': obj.ID,
-                    'data': bytearray(obj.Data)[:obj.DataLen],
-                    'is_extended_id': is_extended,
-                    'timestamp': obj.TimeStamp
-                })
-        return messages
+            # 按 VCI_CAN_OBJ 布局整批解包原始字节，各字段直接写入批缓冲
+            ids, lens, data = batch.ids, batch.lens, batch.data
+            frames = _VCI_OBJ_LAYOUT.iter_unpack(self._rx_raw[:num_frames * _VCI_OBJ_LAYOUT.size])
+            for i, (can_id, dlen, payload) in enumerate(frames):
+                off = i * 8
+                ids[i] = can_id
+                lens[i] = dlen if dlen <= 8 else 8
+                data[off:off + 8] = payload
+            batch.n = num_frames
+        return batch
 
     def send(self, arbitration_id, data, is_extended=True) -> bool:
+        return self.send_batch(((arbitration_id, data),), is_extended) == 1
+
+    def send_batch(self, frames, is_extended=True) -> int:
+        """多帧填入预分配的发送数组，每 TX_CAPACITY 帧只调用一次 VCI_Transmit
+
+        VCI_Transmit 返回实际发出的前若干帧数；某一组未全部发出时不再发送后续组，
+        与基类"遇到失败即停止"的语义一致
+        """
         if not self.is_open:
-            return False
+            return 0
             
-        data_len = len(data)
-        ubyte_array_8 = c_ubyte * 8
-        ubyte_array_3 = c_ubyte * 3
-        
-        data_buf = ubyte_array_8(*list(data) + [0] * (8 - data_len))
-        reserved = ubyte_array_3(0, 0, 0)
-        
-        vci_obj = VCI_CAN_OBJ(
-            arbitration_id, 0, 0, 0, 0, 
-            1 if is_extended else 0, 
-            data_len, data_buf, reserved
-        )
-        
-        ret = self.dll.VCI_Transmit(self.device_type, self.device_index, self.channel, byref(vci_obj), 1)
-        return ret == 1
-
+        objs = self._tx_objs
+        extern_flag = 1 if is_extended else 0
+        sent = 0
+        count = 0
+        for arbitration_id, data in frames:
+            data_len = len(data)
+            if data_len > 8:
+                # 截断后的控制帧含义不可预期: 拒绝该帧，按发送失败处理 (已填入的前序帧照常发出)
+                logger.error(f"❌ CAN TX 数据超过 8 字节，拒绝发送: 0x{arbitration_id:08X} ({data_len} 字节)")
+                if count:
+                    sent += self._transmit(count)
+                return sent
+            # 复用预分配的发送帧，只覆盖 ID/标志/数据 (不足 8 字节补零)
+            vci_obj = objs[count]
+            vci_obj.ID = arbitration_id
+            vci_obj.ExternFlag = extern_flag
+            vci_obj.DataLen = data_len
+            data_addr = ctypes.addressof(vci_obj.Data)
+            # generate_control_packets 产出的就是 bytes，可直接作为源地址，免去一次拷贝
+            ctypes.memmove(data_addr, data if type(data) is bytes else bytes(data), data_len)
+            if data_len < 8:
+                ctypes.memset(data_addr + data_len, 0, 8 - data_len)
+            count += 1
+            if count == self.TX_CAPACITY:
+                ret = self._transmit(count)
+                sent += ret
+                if ret < count:
+                    return sent
+                count = 0
+        if count:
+            sent += self._transmit(count)
+        return sent
+
+    def _transmit(self, count: int) -> int:
+        """发送 _tx_objs 中前 count 帧，返回实际发送的帧数"""
+        ret = self.dll.VCI_Transmit(self.device_type, self.device_index, self.channel, self._tx_objs, count)
+        return ret if ret > 0 else 0
 
 
-class SimpleMessage:
-    def __init__(self, arbitration_id, data, is_extended_id=True):
-        self.arbitration_id = arbitration_id
-        self.data = data
-        self.is_extended_id = is_extended_id
 
 class CANWebSocketServer:
     """CAN to WebSocket bridge server"""
@@ -427,8 +519,15 @@ class CANWebSocketServer:
     def __init__(self):
         self.driver: CANDriver = None
         self.machine_state = MachineState()
-        self.clients: Set[WebSocketServerProtocol] = set()
+        # 已连接客户端 -> 该客户端最近一次收到的广播内容 (用于按客户端去重)
+        self.clients: Dict[WebSocketServerProtocol, Optional[str]] = {}
         self.running = False
+        # CAN 轮询专用线程 (单线程保证批缓冲按顺序复用)
+        self._can_executor: Optional[ThreadPoolExecutor] = None
+        # 状态变化通知: 由 process_can_message 置位, broadcast_loop 等待
+        self._state_changed = asyncio.Event()
+        # 已记录过的未识别 CAN ID
+        self._unknown_ids: Set[int] = set()
         
         # 初始化诊断模块
         self.diagnosis = None
@@ -490,7 +589,11 @@ class CANWebSocketServer:
         # Start WebSocket server
         logger.info(f"Starting WebSocket server on {WEBSOCKET_HOST}:{WEBSOCKET_PORT}")
         try:
-            async with websockets.serve(self.handle_client, WEBSOCKET_HOST, WEBSOCKET_PORT):
+            # 局域网小报文: 关闭 permessage-deflate 省去每条广播的压缩开销；
+            # 上行只有控制指令，限制单条 64KiB。如需 wss:// 请在反向代理终结 TLS
+            async with websockets.serve(self.handle_client, WEBSOCKET_HOST, WEBSOCKET_PORT,
+                                        compression=None, max_size=2**16,
+                                        write_limit=WEBSOCKET_WRITE_LIMIT):
                 logger.info("✓ WebSocket server started")
                 logger.info(f"Frontend should connect to: ws://localhost:{WEBSOCKET_PORT}")
                 
@@ -515,27 +618,43 @@ class CANWebSocketServer:
         msg_count = 0
         last_stats_time = time.time()
         
+        # VCI_Receive 是同步 C 调用，放到专用线程执行；虚拟驱动只做时间判断，直接调用
+        driver = self.driver
+        loop = asyncio.get_running_loop()
+        if driver.BLOCKING_RECEIVE:
+            self._can_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="can-rx")
+        batch_size = CAN_RX_BATCH_SIZE
+        idle_sleep = CAN_RX_IDLE_SLEEP_MIN_S
+        
         while self.running:
             try:
                 # Poll for messages
-                # Since VCI_Receive is blocking/polling in C, we should be careful not to block event loop too long.
-                # However, with wait_time=0 it should be non-blocking.
-                # We can run it in executor if it blocks, but let's try direct call first.
-                
-                messages = self.driver.receive(batch_size=50) # Batch read
+                if self._can_executor is not None:
+                    batch = await loop.run_in_executor(self._can_executor, driver.receive, batch_size)
+                else:
+                    batch = driver.receive(batch_size=batch_size) # Batch read
                 poll_count += 1
                 
-                if messages:
-                    msg_count += len(messages)
-                    # 显示每条消息的ID和数据
-                    for msg_dict in messages:
-                        data_hex = msg_dict['data'].hex().upper()
-                        data_formatted = ' '.join([data_hex[i:i+2] for i in range(0, len(data_hex), 2)])
-                        logger.debug(f"📥 CAN RX | ID: 0x{msg_dict['arbitration_id']:08X} | 数据: {data_formatted}")
-                        
-                        # Convert to object for compatibility
-                        msg = SimpleMessage(msg_dict['arbitration_id'], msg_dict['data'], msg_dict['is_extended_id'])
-                        await self.process_can_message(msg)
+                n = batch.n
+                if n:
+                    msg_count += n
+                    ids = batch.ids
+                    indices = range(n)
+                    # 积压 (如重连后) 时同一 ID 只保留最后一帧，跳过被覆盖的中间帧解析
+                    if n > CAN_RX_COALESCE_THRESHOLD:
+                        latest = {}
+                        for i in indices:
+                            latest[ids[i]] = i
+                        indices = latest.values()
+                    debug = logger.isEnabledFor(logging.DEBUG)
+                    # 解析为纯 CPU 操作，同步调用；整批处理完后统一让出事件循环
+                    process = self.process_can_message
+                    for i in indices:
+                        data = batch.frame(i)
+                        # 显示每条消息的ID和数据
+                        if debug:
+                            logger.debug(f"📥 CAN RX | ID: 0x{ids[i]:08X} | 数据: {data.hex(' ').upper()}")
+                        process(ids[i], data)
                 
                 # 每30秒输出一次统计信息
                 current_time = time.time()
@@ -545,8 +664,14 @@ class CANWebSocketServer:
                         logger.warning("⚠️ 警告: 30秒内未收到任何CAN消息，请检查FCU是否正常发送数据")
                     last_stats_time = current_time
                 
-                # Sleep briefly to yield to event loop
-                await asyncio.sleep(0.01) 
+                # 本轮有数据时立即继续读取直到缓冲区排空 (只让出一次事件循环)；
+                # 空轮询时指数退避，刚空闲时仍能快速响应下一帧，长时间空闲则回到 10ms 轮询
+                if n:
+                    idle_sleep = CAN_RX_IDLE_SLEEP_MIN_S
+                    await asyncio.sleep(0)
+                else:
+                    await asyncio.sleep(idle_sleep)
+                    idle_sleep = min(idle_sleep * 2, CAN_RX_IDLE_SLEEP_MAX_S)
                     
             except asyncio.CancelledError:
                 # Task was cancelled, exit gracefully
@@ -555,46 +680,63 @@ class CANWebSocketServer:
             except Exception as e:
                 logger.error(f"Error in CAN receive loop: {e}")
                 await asyncio.sleep(0.1)
+        
+        self._shutdown_can_executor()
                 
-    async def process_can_message(self, msg):
+    def process_can_message(self, can_id, data):
         """Process incoming CAN message"""
-        can_id = msg.arbitration_id
-        
-        # Check if this is a known message
-        if can_id in MESSAGE_PARSERS:
+        state = self.machine_state
+        
+        # 查表取解析函数 (未知 ID 返回 None)
+        parser = lookup_parser(can_id)
+        if parser is not None:
+            # 先设置连接状态和时间戳，确保解析函数能看到 (解析失败也算链路在线)
+            state.last_update = int(time.time() * 1000)
+            state.connected = True
+            self._state_changed.set()  # 唤醒广播任务
+            
             try:
-                # 先设置连接状态和时间戳，确保解析函数能看到
-                self.machine_state.last_update = int(time.time() * 1000)
-                self.machine_state.connected = True
-                
-                # 然后解析消息
-                parser = MESSAGE_PARSERS[can_id]
-                parser(msg.data, self.machine_state)
-                
-                # Log occasionally (every 100 messages for ID 0x18FF01F0)
-                if can_id == 0x18FF01F0 and self.machine_state.status.get("heartbeat", 0) % 100 == 0:
-                    logger.info(f"CAN RX: 0x{can_id:08X} - Heartbeat: {self.machine_state.status.get('heartbeat')}")
+                parser(data, state)
             except Exception as e:
                 logger.warning(f"❌ Error parsing message 0x{can_id:08X}: {e}")
                 import traceback
                 traceback.print_exc()
+                return
+            
+            # Log occasionally (every 100 messages for ID 0x18FF01F0)
+            if can_id == 0x18FF01F0 and state.status.heartbeat % 100 == 0:
+                logger.info(f"CAN RX: 0x{can_id:08X} - Heartbeat: {state.status.heartbeat}")
         else:
             # 记录未识别的CAN ID (只记录一次)
-            if not hasattr(self, '_unknown_ids'):
-                self._unknown_ids = set()
-                # 启动时显示已配置的CAN ID
-                logger.info(f"📋 已配置的CAN ID: {[f'0x{id:08X}' for id in MESSAGE_PARSERS.keys()]}")
-            if can_id not in self._unknown_ids:
-                self._unknown_ids.add(can_id)
-                logger.warning(f"⚠️ 收到未识别的CAN ID: 0x{can_id:08X}, 数据: {msg.data.hex()}")
+            unknown_ids = self._unknown_ids
+            if can_id not in unknown_ids:
+                if not unknown_ids:
+                    # 首次遇到未知 ID 时显示已配置的CAN ID
+                    logger.info(f"📋 已配置的CAN ID: {[f'0x{id:08X}' for id in MESSAGE_PARSERS.keys()]}")
+                unknown_ids.add(can_id)
+                logger.warning(f"⚠️ 收到未识别的CAN ID: 0x{can_id:08X}, 数据: {data.hex()}")
     
     async def broadcast_loop(self):
-        """Broadcast machine state to all connected clients periodically"""
-        interval = 1.0 / BROADCAST_RATE
+        """Broadcast machine state to all connected clients when it changes (rate-limited)"""
+        interval = BROADCAST_INTERVAL_S
         broadcast_count = 0
         
+        state_changed = self._state_changed
+        loop = asyncio.get_running_loop()
+        # 上一轮是否有客户端因发送缓冲超限而未收到最新内容
+        lagging = False
+        
         while self.running:
             try:
+                # 没有新 CAN 数据时挂起，不再按固定周期空转；唤醒后再按间隔限速。
+                # 有客户端落后时不等待，按间隔继续重试，直到其缓冲排空并收到最新内容
+                if not lagging:
+                    await state_changed.wait()
+                state_changed.clear()
+                lagging = False
+                # 以本次唤醒时刻为基准计算下次最早发送时间 (单调时钟)，编码/发送耗时不再累加到周期上
+                deadline = loop.time() + interval
+                
                 if self.clients:
                     try:
                         # 获取诊断结果
@@ -602,36 +744,44 @@ class CANWebSocketServer:
                         if self.diagnosis:
                             diagnosis_result = self.diagnosis.predict(self.machine_state.to_dict())
                         
-                        message = json.dumps({
-                            "type": "machine_state",
-                            "data": self.machine_state.to_dict(),
-                            "diagnosis": diagnosis_result
-                        })
+                        # 状态部分复用 MachineState 缓存的 JSON 文本，仅诊断结果需要编码
+                        message = '{"type": "machine_state", "data": %s, "diagnosis": %s}' % (
+                            self.machine_state.to_json(), _json_dumps(diagnosis_result))
                         
-                        # Send to all connected clients
-                        disconnected = set()
-                        for client in self.clients:
-                            try:
-                                await client.send(message)
-                            except websockets.exceptions.ConnectionClosed:
-                                disconnected.add(client)
+                        # 按客户端去重: 只发给最近一次收到的内容与本次不同的连接，
+                        # 某个客户端错过的帧不会因为其它客户端已收到而被跳过。
+                        # 发送缓冲已超过上限的慢客户端本次不发 (状态帧只需最新一帧)，
+                        # 其记录保持不变，下一个间隔重试 (即使总线已无新数据)
+                        clients = self.clients
+                        limit = WEBSOCKET_WRITE_LIMIT
+                        targets = []
+                        for ws, last_sent in clients.items():
+                            if last_sent == message:
+                                continue
+                            if ws.transport.get_write_buffer_size() > limit:
+                                lagging = True
+                                continue
+                            clients[ws] = message
+                            targets.append(ws)
                         
-                        # Remove disconnected clients
-                        self.clients -= disconnected
-                        
-                        broadcast_count += 1
-                        if broadcast_count % 100 == 0:
-                            logger.info(f"📡 已向 {len(self.clients)} 个客户端广播状态 (第 {broadcast_count} 次)")
-                        elif broadcast_count <= 5:
-                            state_data = self.machine_state.to_dict()
-                            logger.info(f"🔍 广播数据: connected={state_data.get('connected')}, "
-                                       f"stackVoltage={state_data.get('power', {}).get('stackVoltage')}, "
-                                       f"heartbeat={state_data.get('status', {}).get('heartbeat')}")
+                        if targets:
+                            # websockets.broadcast 同步写入各连接的发送缓冲区，帧只编码一次；
+                            # 已关闭的连接会被跳过，由 handle_client 的 finally 负责移除
+                            websockets.broadcast(targets, message)
+                            
+                            broadcast_count += 1
+                            if broadcast_count % 100 == 0:
+                                logger.info(f"📡 已向 {len(self.clients)} 个客户端广播状态 (第 {broadcast_count} 次)")
+                            elif broadcast_count <= 5:
+                                state_data = self.machine_state.to_dict()
+                                logger.info(f"🔍 广播数据: connected={state_data.get('connected')}, "
+                                           f"stackVoltage={state_data.get('power', {}).get('stackVoltage')}, "
+                                           f"heartbeat={state_data.get('status', {}).get('heartbeat')}")
                             
                     except Exception as e:
                         logger.error(f"Error broadcasting state: {e}")
                 
-                await asyncio.sleep(interval)
+                await asyncio.sleep(max(0.0, deadline - loop.time()))
             except asyncio.CancelledError:
                 # Task was cancelled, exit gracefully
                 logger.info("Broadcast loop cancelled")
@@ -642,15 +792,12 @@ class CANWebSocketServer:
         client_addr = websocket.remote_address
         logger.info(f"Client connected: {client_addr}")
         
-        # Add to clients set
-        self.clients.add(websocket)
+        # Add to clients (尚未收到任何广播)
+        self.clients[websocket] = None
         
         try:
             # Send initial state
-            initial_message = json.dumps({
-                "type": "machine_state",
-                "data": self.machine_state.to_dict()
-            })
+            initial_message = '{"type": "machine_state", "data": %s}' % self.machine_state.to_json()
             await websocket.send(initial_message)
             
             # Listen for control commands
@@ -662,13 +809,13 @@ class CANWebSocketServer:
         except Exception as e:
             logger.error(f"Error handling client {client_addr}: {e}")
         finally:
-            # Remove from clients set
-            self.clients.discard(websocket)
+            # Remove from clients
+            self.clients.pop(websocket, None)
     
     async def handle_client_message(self, message: str):
         """Handle incoming WebSocket message from client"""
         try:
-            data = json.loads(message)
+            data = _json_loads(message)
             msg_type = data.get("type")
             
             if msg_type == "control":
@@ -679,11 +826,10 @@ class CANWebSocketServer:
                 packets = generate_control_packets(control)
                 
                 # Send all packets to CAN bus
-                sent_count = 0
-                for can_id, can_data in packets:
-                    success = self.driver.send(can_id, can_data, is_extended=True)
-                    if success:
-                        sent_count += 1
+                # 一次性下发全部报文 (ZLG 驱动合并为一次 VCI_Transmit)，按顺序返回成功帧数
+                sent_count = self.driver.send_batch(packets, is_extended=True)
+                for idx, (can_id, can_data) in enumerate(packets):
+                    if idx < sent_count:
                         logger.info(f"📤 CAN TX | ID: 0x{can_id:08X} | 数据: {can_data.hex().upper()}")
                     else:
                         logger.warning(f"❌ Failed to send CAN TX: 0x{can_id:08X}")
@@ -713,12 +859,26 @@ class CANWebSocketServer:
         except Exception as e:
             logger.error(f"Error handling client message: {e}")
     
+    def _shutdown_can_executor(self):
+        """关闭 CAN 接收线程，并等待正在执行的 driver.receive 返回
+
+        驱动关闭 (VCI_CloseDevice) 不能与 VCI_Receive 在厂商 DLL 内并发执行；
+        WaitTime 为 0，单次接收很快返回，等待几乎没有开销
+        """
+        if self._can_executor is not None:
+            self._can_executor.shutdown(wait=True)
+            self._can_executor = None
+
     def stop(self):
         """Stop the server"""
         self.running = False
+        # 接收循环可能尚未退出 (任务取消晚于 stop)，关闭驱动前先等待接收线程结束
+        self._shutdown_can_executor()
         if self.driver:
             self.driver.close()
             logger.info("CAN bus closed")
+        if self.diagnosis:
+            self.diagnosis.close()
 
 
 async def main():
@@ -742,4 +902,7 @@ if __name__ == "__main__":
     print("=" * 60, flush=True)
     print("启动 H2 FCU Backend Server...", flush=True)
     print("=" * 60, flush=True)
-    asyncio.run(main())
+    if UVLOOP_AVAILABLE:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -0,0 +1,116 @@
+"""
+状态广播测试：broadcast_loop 的按客户端去重与慢客户端重试
+
+以伪连接代替 WebSocket 连接，websockets.broadcast 替换为记录调用
+
+用法：
+    python test_broadcast.py      (或 pytest test_broadcast.py)
+"""
+
+import asyncio
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import server
+from can_protocol1 import MachineState, dispatch
+from server import CANWebSocketServer
+
+
+class _FakeTransport:
+    def __init__(self, buffered=0):
+        self.buffered = buffered
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+
+class _FakeConnection:
+    """只提供 broadcast_loop 用到的 transport，收到的消息由替换后的 broadcast 记录"""
+
+    def __init__(self, buffered=0):
+        self.transport = _FakeTransport(buffered)
+        self.received = []
+
+
+def _record_broadcast(targets, message):
+    for ws in targets:
+        ws.received.append(message)
+
+
+def _power_frame(stack_voltage_raw):
+    return struct.pack('<HHHH', stack_voltage_raw, 2000, 2715, 1187)
+
+
+async def _until(cond, timeout=1.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not cond():
+        assert loop.time() < deadline, "等待超时"
+        await asyncio.sleep(0.001)
+
+
+async def _run_scenario():
+    bridge = CANWebSocketServer.__new__(CANWebSocketServer)
+    bridge.machine_state = MachineState()
+    bridge.diagnosis = None
+    bridge.running = True
+    bridge._state_changed = asyncio.Event()
+
+    fast = _FakeConnection()
+    slow = _FakeConnection(buffered=server.WEBSOCKET_WRITE_LIMIT + 1)
+    bridge.clients = {fast: None, slow: None}
+    task = asyncio.create_task(bridge.broadcast_loop())
+
+    def new_frame(raw):
+        assert dispatch(0x18FF02F0, _power_frame(raw), bridge.machine_state)
+        bridge._state_changed.set()
+
+    try:
+        # 发送缓冲超限的客户端本次被跳过，其它客户端正常收到
+        new_frame(15000)
+        await _until(lambda: len(fast.received) == 1)
+        await asyncio.sleep(0.02)   # 期间持续重试慢客户端
+        assert slow.received == []
+        assert len(fast.received) == 1          # 内容未变: 不重复发送
+
+        # 缓冲排空后，即使总线没有新数据，慢客户端也会收到最新状态，且只收到一次
+        slow.transport.buffered = 0
+        await _until(lambda: len(slow.received) == 1)
+        assert slow.received == fast.received
+        await asyncio.sleep(0.02)
+        assert len(fast.received) == 1 and len(slow.received) == 1
+
+        # 唤醒但状态未变: 不再发送
+        bridge._state_changed.set()
+        await asyncio.sleep(0.02)
+        assert len(fast.received) == 1 and len(slow.received) == 1
+
+        # 状态变化: 两个客户端各收到一次新内容
+        new_frame(16000)
+        await _until(lambda: len(fast.received) == 2 and len(slow.received) == 2)
+        assert fast.received[1] == slow.received[1] != fast.received[0]
+        assert bridge.clients == {fast: fast.received[1], slow: slow.received[1]}
+    finally:
+        bridge.running = False
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def test_broadcast_dedupes_per_client_and_retries_lagging():
+    original = (server.websockets.broadcast, server.BROADCAST_INTERVAL_S)
+    server.websockets.broadcast = _record_broadcast
+    server.BROADCAST_INTERVAL_S = 0.001
+    try:
+        asyncio.run(_run_scenario())
+    finally:
+        server.websockets.broadcast, server.BROADCAST_INTERVAL_S = original
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✓ {name}")
@@ -0,0 +1,98 @@
+"""
+CAN 协议解析测试：用已知报文驱动 can_protocol1，校验前端看到的 to_dict() 输出
+
+用法：
+    python test_can_protocol.py      (或 pytest test_can_protocol.py)
+"""
+
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import can_protocol
+from can_protocol1 import MachineState, dispatch, generate_control_packets
+
+
+# 已知报文 (与 VirtualDriver 的编码方式一致)
+FRAME_STATUS = (0x18FF01F0, bytes([0x2A, 0x06, 0, 0, 0, 0, 0, 0]))         # 心跳 42, 状态 2, 故障等级 1
+FRAME_POWER = (0x18FF02F0, struct.pack('<HHHH', 15000, 2000, 2715, 1187))  # 150V, 200A, 27.15V, 118.7A
+FRAME_SENSORS = (0x18FF03F0, struct.pack('>HHHB', 1000, 1200, 850, 37) + b'\x00')
+FRAME_IO = (0x18FF04F0, struct.pack('>BBHH', 0x39, 55, 850, 0x1234) + b'\x00\x00')
+
+
+def _parse(*frames) -> MachineState:
+    state = MachineState()
+    for can_id, data in frames:
+        assert dispatch(can_id, data, state)
+    return state
+
+
+def test_to_dict_known_frames():
+    d = _parse(FRAME_STATUS, FRAME_POWER, FRAME_SENSORS, FRAME_IO).to_dict()
+
+    assert d["status"] == {"heartbeat": 42, "state": 2, "faultLevel": 1}
+    assert d["power"] == {
+        "stackVoltage": 150.0,
+        "stackCurrent": 200.0,
+        "stackPower": 30.0,
+        "dcfOutVoltage": 27.15,
+        "dcfOutCurrent": 118.7,
+        "dcfPower": 3222.7,
+        "dcfEfficiency": 10.7,
+    }
+    assert d["sensors"]["stackTemp"] == 60.0
+    assert d["sensors"]["h2CylinderPressure"] == 12.0
+    assert d["sensors"]["h2InletPressure"] == 8.5
+    assert d["sensors"]["h2Concentration"] == 18.5
+    assert d["io"] == {
+        "h2InletValve": True,
+        "h2PurgeValve": False,
+        "proportionalValve": False,
+        "heater": True,
+        "fan1": True,
+        "fan2": True,
+        "fan1Duty": 55,
+        "dcfMosTemp": 45.0,
+        "faultCode": 0x34,
+    }
+
+
+def test_dcf_power_uses_rounded_voltage_and_current():
+    # 27.15V x 118.7A: 未取整值相乘为 3222.71，前端显示值相乘为 3222.7
+    power = _parse(FRAME_POWER).to_dict()["power"]
+    assert power["dcfPower"] == round(power["dcfOutVoltage"] * power["dcfOutCurrent"], 2) == 3222.7
+
+
+def test_to_dict_refreshes_after_new_frame():
+    state = _parse(FRAME_STATUS)
+    first = state.to_dict()["status"]["heartbeat"]
+    assert dispatch(0x18FF01F0, bytes([0x2B, 0x06, 0, 0, 0, 0, 0, 0]), state)
+    assert (first, state.to_dict()["status"]["heartbeat"]) == (42, 43)
+
+
+def test_short_and_unknown_frames():
+    state = _parse(FRAME_POWER)
+    before = dict(state.to_dict()["power"])
+    assert dispatch(0x18FF02F0, b'\x00\x00', state)      # 长度不足: 已知 ID 但不更新字段
+    assert state.to_dict()["power"] == before
+    assert not dispatch(0x18FF09F0, bytes(8), state)     # 未知 ID
+
+
+def test_control_packets_unhashable_mode():
+    # 前端发来列表/字典等不可哈希的 mode/command: 按手动/停止处理，不抛异常
+    manual = generate_control_packets({"mode": 0, "command": 1})
+    for bad in ([1], {"AUTO": 1}):
+        assert generate_control_packets({"mode": bad, "command": 1}) == manual
+        assert can_protocol.generate_control_packets({"mode": bad, "command": bad}) == \
+            can_protocol.generate_control_packets({"mode": "MANUAL", "command": "STOP"})
+    assert generate_control_packets({"mode": "AUTO"})[0][1][0] & 0x03 == 1
+    assert generate_control_packets({"mode": 1.0})[0][1][0] & 0x03 == 1
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✓ {name}")
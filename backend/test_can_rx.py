@@ -0,0 +1,181 @@
+"""
+CAN 接收链路测试：驱动批缓冲 (RxBatch) -> 解析 -> MachineState.to_dict()
+
+覆盖 VirtualDriver 与 ZLGDriver (以桩 DLL 代替 ControlCAN.dll，可在非 Windows 环境运行)
+
+用法：
+    python test_can_rx.py      (或 pytest test_can_rx.py)
+"""
+
+import os
+import struct
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from can_protocol1 import MachineState, dispatch
+import server
+from server import RxBatch, VirtualDriver, ZLGDriver
+
+
+class StubDLL:
+    """ControlCAN.dll 桩: VCI_Receive 把预置帧按 ctypes 字段写入驱动的接收缓冲"""
+
+    def __init__(self):
+        self.driver = None
+        self.rx_frames = []    # [(ID, DataLen, data, TimeStamp)]
+        self.rx_calls = []     # 每次 VCI_Receive 请求的帧数
+
+    def VCI_Receive(self, device_type, device_index, channel, buf, length, wait_time):
+        self.rx_calls.append(length)
+        frames, self.rx_frames = self.rx_frames[:length], self.rx_frames[length:]
+        objs = self.driver._rx_buffer.STRUCT_ARRAY
+        for i, (can_id, data_len, data, timestamp) in enumerate(frames):
+            obj = objs[i]
+            obj.ID = can_id
+            obj.TimeStamp = timestamp
+            obj.ExternFlag = 1
+            obj.DataLen = data_len
+            obj.Data[:] = list(data.ljust(8, b'\x00'))
+        return len(frames)
+
+
+class StubZLGDriver(ZLGDriver):
+    """跳过 Windows DLL 加载，改用 StubDLL"""
+
+    def _load_dll(self):
+        self.dll = StubDLL()
+        self.dll.driver = self
+
+
+def _batch_frames(batch: RxBatch):
+    return [(batch.ids[i], bytes(batch.frame(i))) for i in range(batch.n)]
+
+
+def _open_zlg() -> StubZLGDriver:
+    driver = StubZLGDriver()
+    driver.is_open = True
+    return driver
+
+
+def test_rx_batch_frame_view():
+    batch = RxBatch(2)
+    batch.ids[1] = 0x18FF02F0
+    batch.lens[1] = 3
+    batch.data[8:11] = b'\x01\x02\x03'
+    view = batch.frame(1)
+    assert isinstance(view, memoryview)
+    assert bytes(view) == b'\x01\x02\x03'
+
+
+def test_virtual_driver_batch():
+    # 固定 server 中的时钟: elapsed = 0，正弦项为 0，数值确定且与机器负载无关
+    original = server.time
+    server.time = types.SimpleNamespace(time=lambda: 1000.0)
+    try:
+        _check_virtual_driver_batch()
+    finally:
+        server.time = original
+
+
+def _check_virtual_driver_batch():
+    driver = VirtualDriver()
+    driver.start()
+    driver.io_flags = 0x19            # 进气阀 | 加热器 | 风扇1
+    driver.fan1_duty = 40
+
+    batch = driver.receive()
+    assert batch.n == 4
+    assert [batch.ids[i] for i in range(4)] == [0x18FF01F0, 0x18FF02F0, 0x18FF03F0, 0x18FF04F0]
+    assert [batch.lens[i] for i in range(4)] == [8, 8, 8, 8]
+    assert bytes(batch.frame(1)) == struct.pack('<HHHH', 15000, 2000, 2400, 11875)
+
+    state = MachineState()
+    for can_id, data in ((batch.ids[i], batch.frame(i)) for i in range(batch.n)):
+        assert dispatch(can_id, data, state)
+    d = state.to_dict()
+    assert d["status"] == {"heartbeat": 0, "state": 2, "faultLevel": 0}
+    assert d["power"]["stackVoltage"] == 150.0
+    assert d["power"]["stackCurrent"] == 200.0
+    assert d["power"]["dcfOutVoltage"] == 24.0
+    assert d["power"]["dcfOutCurrent"] == 1187.5
+    assert d["power"]["dcfPower"] == 28500.0
+    assert d["io"]["h2InletValve"] and d["io"]["heater"] and d["io"]["fan1"]
+    assert not d["io"]["h2PurgeValve"] and not d["io"]["fan2"]
+    assert d["io"]["fan1Duty"] == 40
+
+    # 同一周期内再次轮询: 复用同一批缓冲且无新帧
+    again = driver.receive()
+    assert again is batch and again.n == 0
+
+
+def test_zlg_driver_batch_to_dict():
+    driver = _open_zlg()
+    driver.dll.rx_frames = [
+        (0x18FF01F0, 8, bytes([0x2A, 0x06, 0, 0, 0, 0, 0, 0]), 100),
+        (0x18FF02F0, 8, struct.pack('<HHHH', 15000, 2000, 2715, 1187), 101),
+        (0x18FF04F0, 6, struct.pack('>BBHH', 0x39, 55, 850, 0x1234), 102),
+    ]
+
+    batch = driver.receive(batch_size=50)
+    assert driver.dll.rx_calls == [50]
+    assert batch.n == 3
+    assert [batch.lens[i] for i in range(3)] == [8, 8, 6]
+    assert _batch_frames(batch)[2] == (0x18FF04F0, struct.pack('>BBHH', 0x39, 55, 850, 0x1234))
+
+    state = MachineState()
+    for i in range(batch.n):
+        assert dispatch(batch.ids[i], batch.frame(i), state)
+    d = state.to_dict()
+    assert d["status"]["heartbeat"] == 42
+    assert d["power"]["dcfOutVoltage"] == 27.15
+    assert d["power"]["dcfPower"] == 3222.7
+    assert d["io"]["fan1Duty"] == 55
+    assert d["io"]["faultCode"] == 0x34
+
+    # 下一次轮询复用同一批缓冲；无帧时 n 归零
+    assert driver.receive() is batch and batch.n == 0
+
+
+def test_zlg_raw_layout_matches_ctypes_fields():
+    # receive() 按 _VCI_OBJ_LAYOUT 直接解包原始内存: 逐字段写入后比对，
+    # 包括 DataLen > 8 (截断为 8)、短帧、以及时间戳/各标志/保留字节非零 (必须被跳过)
+    driver = _open_zlg()
+    n = driver.RX_CAPACITY                 # 覆盖整块缓冲，包括最后一帧
+    objs = driver._rx_buffer.STRUCT_ARRAY
+    expected = []
+    for i in range(n):
+        obj = objs[i]
+        data_len = (0, 1, 3, 7, 8, 9, 15, 255)[i % 8]
+        payload = bytes((i * 8 + k) & 0xFF for k in range(8))
+        obj.ID = 0x18FF0000 | (i << 4) | 0x0F
+        obj.TimeStamp = 0xFFFF0000 + i
+        obj.TimeFlag, obj.SendType, obj.RemoteFlag, obj.ExternFlag = 0xA1, 0xB2, 0xC3, 0xD4
+        obj.DataLen = data_len
+        obj.Data[:] = list(payload)
+        obj.Reserved[:] = [0xEE, 0xEE, 0xEE]
+        expected.append((obj.ID, min(data_len, 8), payload[:min(data_len, 8)]))
+    driver.dll.VCI_Receive = lambda *args: n
+
+    batch = driver.receive(batch_size=n)
+    assert batch.n == n
+    got = [(batch.ids[i], batch.lens[i], bytes(batch.frame(i))) for i in range(n)]
+    assert got == expected
+
+
+def test_zlg_driver_closed_or_oversized_request():
+    driver = _open_zlg()
+    driver.dll.rx_frames = [(0x18FF01F0, 8, bytes(8), 0)] * 3
+    assert driver.receive(batch_size=10_000).n == 3
+    assert driver.dll.rx_calls == [driver.RX_CAPACITY]   # 请求不超过预分配容量
+
+    driver.is_open = False
+    assert driver.receive().n == 0
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✓ {name}")
@@ -0,0 +1,164 @@
+"""
+CAN 发送链路测试：send_batch 分组发送、部分发送、短帧补零，以及控制命令的逐帧日志
+
+ZLGDriver 以桩 DLL 代替 ControlCAN.dll，可在非 Windows 环境运行
+
+用法：
+    python test_can_tx.py      (或 pytest test_can_tx.py)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import server
+from server import CANWebSocketServer, VirtualDriver, ZLGDriver
+
+
+class StubTxDLL:
+    """ControlCAN.dll 桩: 记录每次 VCI_Transmit 收到的帧，并按 accept 依次返回实际发出的帧数"""
+
+    def __init__(self, accept=None):
+        self.accept = list(accept or [])   # 每次调用的返回值；为空时全部发出
+        self.calls = []                    # [[(ID, ExternFlag, DataLen, Data), ...], ...]
+
+    def VCI_Transmit(self, device_type, device_index, channel, objs, length):
+        self.calls.append([(objs[i].ID, objs[i].ExternFlag, objs[i].DataLen, bytes(objs[i].Data))
+                           for i in range(length)])
+        return self.accept.pop(0) if self.accept else length
+
+
+class StubZLGDriver(ZLGDriver):
+    """跳过 Windows DLL 加载，改用 StubTxDLL"""
+
+    def _load_dll(self):
+        self.dll = StubTxDLL()
+
+
+def _open_zlg(accept=None) -> StubZLGDriver:
+    driver = StubZLGDriver()
+    driver.dll.accept = list(accept or [])
+    driver.is_open = True
+    return driver
+
+
+def _frames(count):
+    return [(0x18FF0B00 + i, bytes([i]) * 8) for i in range(count)]
+
+
+def test_send_batch_chunks_at_tx_capacity():
+    driver = _open_zlg()
+    frames = _frames(driver.TX_CAPACITY + 2)
+    assert driver.send_batch(frames) == len(frames)
+    assert [len(call) for call in driver.dll.calls] == [driver.TX_CAPACITY, 2]
+    sent = [frame for call in driver.dll.calls for frame in call]
+    assert [(f[0], f[3]) for f in sent] == frames
+
+
+def test_send_batch_stops_after_partial_send():
+    # 第一组只发出 3 帧: 返回 3，且不再发送第二组
+    driver = _open_zlg(accept=[3])
+    assert driver.send_batch(_frames(driver.TX_CAPACITY + 2)) == 3
+    assert len(driver.dll.calls) == 1
+
+    # 第二组部分发出: 返回第一组全部 + 第二组实际发出的帧数
+    driver = _open_zlg(accept=[ZLGDriver.TX_CAPACITY, 1])
+    assert driver.send_batch(_frames(driver.TX_CAPACITY + 2)) == driver.TX_CAPACITY + 1
+
+    # DLL 返回错误 (-1) 按 0 帧处理
+    driver = _open_zlg(accept=[-1, -1])
+    assert driver.send_batch(_frames(2)) == 0
+    assert not driver.send(0x123, bytes(8))
+
+
+def test_send_zero_pads_short_payload():
+    driver = _open_zlg()
+    assert driver.send(0x18FF10A0, b'\xFF' * 8)
+    # 复用同一发送帧: 短帧剩余字节必须清零，不能残留上一帧的数据
+    assert driver.send(0x123, bytearray(b'\x01\x02\x03'), is_extended=False)
+    assert driver.dll.calls[-1] == [(0x123, 0, 3, b'\x01\x02\x03\x00\x00\x00\x00\x00')]
+    assert driver.dll.calls[0] == [(0x18FF10A0, 1, 8, b'\xFF' * 8)]
+
+
+def test_send_batch_rejects_oversized_payload():
+    # 超过 8 字节的帧不截断发送: 前序帧照常发出，该帧及后续帧不发送
+    driver = _open_zlg()
+    frames = [(0x18FF0B27, bytes(8)), (0x18FF0B28, bytes(9)), (0x18FF0B32, bytes(8))]
+    assert driver.send_batch(frames) == 1
+    assert [[f[0] for f in call] for call in driver.dll.calls] == [[0x18FF0B27]]
+    assert not driver.send(0x123, bytes(12))
+    assert len(driver.dll.calls) == 1
+
+
+def test_send_batch_closed_device():
+    driver = _open_zlg()
+    driver.is_open = False
+    assert driver.send_batch(_frames(3)) == 0
+    assert not driver.send(0x123, bytes(8))
+    assert driver.dll.calls == []
+
+
+def test_base_send_batch_stops_at_first_failure():
+    class FlakyDriver(VirtualDriver):
+        def __init__(self):
+            super().__init__()
+            self.sent = []
+
+        def send(self, arbitration_id, data, is_extended=True) -> bool:
+            if len(self.sent) == 1:
+                return False
+            self.sent.append(arbitration_id)
+            return True
+
+    driver = FlakyDriver()
+    assert driver.send_batch(_frames(3)) == 1
+    assert driver.sent == [0x18FF0B00]
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_control_message_logs_each_frame():
+    # 控制命令生成 3 帧，DLL 只发出前 2 帧: 前 2 帧记为已发送，第 3 帧记为失败
+    packets = [(0x18FF0B27, bytes(8)), (0x18FF0B28, bytes(8)), (0x18FF0B32, bytes(8))]
+    bridge = CANWebSocketServer.__new__(CANWebSocketServer)
+    bridge.driver = _open_zlg(accept=[2])
+    bridge.diagnosis = None
+
+    # 不依赖 server.py 中 logging.basicConfig 设置的根日志级别 (pytest 下该调用不生效)
+    handler = _ListHandler()
+    level = server.logger.level
+    server.logger.setLevel(logging.INFO)
+    server.logger.addHandler(handler)
+    original = server.generate_control_packets
+    server.generate_control_packets = lambda control: packets
+    try:
+        asyncio.run(bridge.handle_client_message(json.dumps({"type": "control", "data": {}})))
+    finally:
+        server.generate_control_packets = original
+        server.logger.removeHandler(handler)
+        server.logger.setLevel(level)
+
+    messages = [(r.levelno, r.getMessage()) for r in handler.records]
+    assert (logging.INFO, "📤 CAN TX | ID: 0x18FF0B27 | 数据: 0000000000000000") in messages
+    assert (logging.INFO, "📤 CAN TX | ID: 0x18FF0B28 | 数据: 0000000000000000") in messages
+    assert (logging.WARNING, "❌ Failed to send CAN TX: 0x18FF0B32") in messages
+    assert (logging.INFO, "✅ 发送控制命令: 2/3 个报文成功") in messages
+    assert len(bridge.driver.dll.calls) == 1
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✓ {name}")
@@ -0,0 +1,106 @@
+"""
+在线诊断测试 (规则诊断模式)：节流复用、特征缓冲复用、反馈保存与重新加载
+
+模型目录使用临时目录 (不存在模型文件)，无论是否安装 TensorFlow 都走规则诊断
+
+用法：
+    python test_diagnosis.py      (或 pytest test_diagnosis.py)
+"""
+
+import json
+import os
+import struct
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from can_protocol1 import MachineState, dispatch
+from diagnosis import OnlineDiagnosis
+
+
+def _machine_state(stack_voltage_raw=15000, fault_code=0):
+    state = MachineState()
+    assert dispatch(0x18FF02F0, struct.pack('<HHHH', stack_voltage_raw, 2000, 2715, 1187), state)
+    assert dispatch(0x18FF04F0, struct.pack('>BBHH', 0, 0, 850, fault_code) + b'\x00\x00', state)
+    return state.to_dict()
+
+
+def _sample(i):
+    return {"timestamp": str(i), "features": [float(i)] * 7, "label": "normal",
+            "machine_state_snapshot": {}}
+
+
+def test_predict_reuses_result_within_throttle():
+    with tempfile.TemporaryDirectory() as model_dir:
+        diag = OnlineDiagnosis(model_dir=model_dir)
+        try:
+            assert diag.model is None
+            first = diag.predict(_machine_state())
+            assert first["label"] == "normal"
+            # 节流间隔内: 即使状态变化也直接复用上次结果
+            assert diag.predict(_machine_state(fault_code=0x12)) is first
+
+            diag._last_predict_time -= diag._predict_interval   # 模拟间隔已过
+            second = diag.predict(_machine_state(fault_code=0x12))
+            assert second is not first
+            assert second["label"] == "thermal_issue" and second["confidence"] == 90.0
+        finally:
+            diag.close()
+
+
+def test_extract_features_reuses_buffer():
+    with tempfile.TemporaryDirectory() as model_dir:
+        diag = OnlineDiagnosis(model_dir=model_dir)
+        try:
+            a = diag.extract_features(_machine_state(15000))
+            assert a[0] == 150.0
+            b = diag.extract_features(_machine_state(16000))
+            assert b is a and a[0] == 160.0
+            # 反馈样本保存特征的副本，不随缓冲区改写
+            assert diag.add_feedback(_machine_state(15000), "normal")
+            diag.extract_features(_machine_state(16000))
+            assert diag.feedback_samples[-1]["features"][0] == 150.0
+        finally:
+            diag.close()
+
+
+def test_add_feedback_then_close_writes_file():
+    with tempfile.TemporaryDirectory() as model_dir:
+        diag = OnlineDiagnosis(model_dir=model_dir)
+        assert diag.add_feedback(_machine_state(), "flooding")
+        assert not diag.add_feedback(_machine_state(), "unknown_label")
+        diag.close()   # 不足 10 条的样本在 close() 时写入并等待完成
+
+        with open(diag.data_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        assert data["sample_count"] == 1
+        assert [s["label"] for s in data["samples"]] == ["flooding"]
+        assert data["samples"][0]["machine_state_snapshot"]["power"]["stackVoltage"] == 150.0
+
+
+def test_reload_keeps_last_100_samples():
+    with tempfile.TemporaryDirectory() as model_dir:
+        diag = OnlineDiagnosis(model_dir=model_dir)
+        with open(diag.data_path, 'w', encoding='utf-8') as f:
+            json.dump({"sample_count": 150, "samples": [_sample(i) for i in range(150)]}, f)
+        try:
+            diag._load_feedback()
+            assert diag.sample_count == 150
+            assert len(diag.feedback_samples) == 100
+            assert diag.feedback_samples[0]["timestamp"] == "50"
+            assert diag.feedback_samples[-1]["timestamp"] == "149"
+
+            # 继续追加时仍只保留最近 100 条
+            assert diag.add_feedback(_machine_state(), "normal")
+            assert len(diag.feedback_samples) == 100
+            assert diag.feedback_samples[0]["timestamp"] == "51"
+        finally:
+            diag.close()
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✓ {name}")